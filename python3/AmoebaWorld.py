@@ -5,12 +5,16 @@ Copyright 2011 Allen B. Downey
 Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
 """
 
+import array
+import base64
+import csv
 import math
 import random
 import time
 
-from tkinter import END
+from tkinter import END, NW
 from .World import World, Animal, MyThread
+from .Figure import png_data
 
 
 class AmoebaWorld(World):
@@ -18,13 +22,25 @@ class AmoebaWorld(World):
 
     Attributes:
         delay: time step in ms
+        verbose: boolean, whether to print the position at each step
+        functions: map from expression strings to compiled functions of t
+        track: the Trajectory play uses, or None
+        after_id: id of the next scheduled step of run or play, or None
     """
 
-    def __init__(self, interactive=False, delay=100):
-        World.__init__(self)
+    # functions stops growing at max_functions, in case the user
+    # types many different expressions.
+    max_functions = 100
+
+    def __init__(self, interactive=False, delay=100, backend=None, verbose=False):
+        World.__init__(self, backend=backend)
         self.delay = delay
+        self.verbose = verbose
         self.title("AmoebaWorld")
         self.running = False
+        self.functions = {}
+        self.track = None
+        self.after_id = None
 
         self.make_canvas()
         if interactive:
@@ -48,6 +64,9 @@ class AmoebaWorld(World):
         for y in range(ymin, ymax + 1, 1):
             self.canvas.line([[xmin, y], [xmax, y]], dash=d[y == 0])
 
+        # amoebas leave slime on a layer above the grid marks
+        self.slime = SlimeLayer(self, self.canvas, self.ca_width, self.ca_height)
+
     def make_control_panel(self):
         """Makes the buttons and input fields."""
         # buttons
@@ -96,53 +115,339 @@ class AmoebaWorld(World):
 
     def run(self):
         """Runs the amoebas in real time."""
-        if self.running:
-            # after_cancel
-            pass
-
+        self.cancel()
         self.running = True
         self.clear()
 
         # find out how long to run
-        end = self.en_end.get()
         try:
-            self.end = float(eval(end))
+            self.end = self.get_end_time()
         except:
             print("End time must be a numeric expression.")
             return
 
+        # compile x(t) and y(t) now, so errors show up right away
+        try:
+            self.get_functions()
+        except SyntaxError:
+            print("x(t) and y(t) must be expressions in t.")
+            return
+
         self.start_time = time.time()
-        self.after(0, self.step)
+        self.after_id = self.after(0, self.step)
+
+    def stop(self):
+        """Stops running or playing."""
+        World.stop(self)
+        self.cancel()
+
+    def cancel(self):
+        """Cancels the next step of run or play, if there is one."""
+        if self.after_id is not None:
+            self.after_cancel(self.after_id)
+            self.after_id = None
+
+    def get_function(self, entry):
+        """Returns a function of t that evaluates the expression in entry.
+
+        Functions are cached by the text of the expression, so it is
+        only compiled again if the entry changes.
+        """
+        source = entry.get()
+        func = self.functions.get(source)
+        if func is None:
+            func = make_function(source)
+            if len(self.functions) < self.max_functions:
+                self.functions[source] = func
+        return func
+
+    def get_functions(self):
+        """Returns the functions x(t) and y(t) from the entries."""
+        return self.get_function(self.en_x_t), self.get_function(self.en_y_t)
+
+    def trajectory(self, ts):
+        """Evaluates x(t) and y(t) for a sequence of times.
+
+        Args:
+            ts: sequence of times
+
+        Returns:
+            tuple of lists, xs and ys
+        """
+        fx, fy = self.get_functions()
+        return list(map(fx, ts)), list(map(fy, ts))
+
+    def get_end_time(self):
+        """Reads the end time entry."""
+        return float(eval(self.en_end.get()))
+
+    def precompute(self, end=None, dt=None):
+        """Samples x(t) and y(t) at a fixed time step, for play.
+
+        Args:
+            end: end time in seconds; default is the end time entry
+            dt: time step in seconds; default is delay
+
+        Returns:
+            Trajectory, which is also saved as self.track
+        """
+        if end is None:
+            end = self.get_end_time()
+        if dt is None:
+            dt = self.delay / 1000.0
+
+        n = int(round(end / dt)) + 1
+        xs, ys = self.trajectory([i * dt for i in range(n)])
+        self.track = Trajectory(dt, xs, ys)
+        return self.track
+
+    def play(self, track=None, start=0):
+        """Plays a precomputed Trajectory in real time.
+
+        Each frame shows the sample for the current time, so if frames
+        are late, samples are skipped rather than falling behind, and
+        every run shows the same positions.
+
+        Args:
+            track: Trajectory; default is self.track, which is
+                   computed if necessary
+            start: time to start from in seconds
+        """
+        if track is not None:
+            self.track = track
+        if self.track is None:
+            self.precompute()
+
+        self.cancel()
+        self.running = True
+        self.start_time = time.time() - start
+        self.after_id = self.after(0, self.play_step)
+
+    def play_step(self):
+        """Shows the amoebas at the current time of the playback."""
+        if not self.exists or not self.running:
+            return
+
+        t = time.time() - self.start_time
+        self.show(t)
+        if t < self.track.end:
+            self.after_id = self.after(self.delay, self.play_step)
+        else:
+            self.running = False
+            self.after_id = None
+
+    def seek(self, t):
+        """Shows the amoebas at time t; if playing, continues from there.
+
+        Computes the trajectory first if necessary, like play.
+        """
+        if self.track is None:
+            self.precompute()
+        self.start_time = time.time() - t
+        self.show(t)
+
+    def show(self, t):
+        """Moves the amoebas to their precomputed positions at time t."""
+        x, y = self.track.position(t)
+        for amoeba in self.animals:
+            amoeba.move(x, y)
 
     def step(self):
         """Advance the Amoebas one step."""
         if not self.exists or not self.running:
             return
 
-        xexpr = self.en_x_t.get()
-        yexpr = self.en_y_t.get()
+        fx, fy = self.get_functions()
 
         # see how much time has elapsed and evaluate x(t) and y(t)
         t = time.time() - self.start_time
 
         if t > self.end:
+            self.running = False
+            self.after_id = None
             return
 
-        x = eval(xexpr)
-        y = eval(yexpr)
-        print("t = %.1f   x = %.1f   y = %.1f" % (t, x, y))
+        x = fx(t)
+        y = fy(t)
+        if self.verbose:
+            print("t = %.1f   x = %.1f   y = %.1f" % (t, x, y))
 
         for amoeba in self.animals:
             amoeba.move(x, y)
 
         # schedule the next step
-        self.after(self.delay, self.step)
+        self.after_id = self.after(self.delay, self.step)
 
     def clear(self):
         """Clears the amoebas and slime (but not the grid marks)."""
         for animal in self.animals:
             animal.undraw()
-        self.canvas.delete("slime")
+        self.slime.clear()
+
+
+class SlimeLayer(object):
+    """A transparent image that covers the canvas, where amoebas leave slime.
+
+    Drawing the slime into an image, rather than making a polygon
+    for each step, keeps the number of canvas items constant, no
+    matter how long the amoebas run.
+
+    The slime is drawn into pixels first; flush copies the part that
+    changed into the image with a single put, when the Gui is idle.
+
+    Attributes:
+        gui: the Gui that schedules flushes
+        canvas: GuiCanvas
+        width, height: size of the canvas in pixels
+        image: PhotoImage the size of the canvas
+        item: the canvas Item that shows the image
+        pixels: bytearray of r, g, b, a values, row by row from the top
+        bbox: [col1, row1, col2, row2] of the pixels that changed since
+              the last flush, or None
+        colors: map from color names to r, g, b, a bytes
+    """
+
+    def __init__(self, gui, canvas, width, height):
+        self.gui = gui
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.image = canvas.photo_image(width=width, height=height)
+        self.pixels = bytearray(4 * width * height)
+        self.bbox = None
+        self.colors = {}
+
+        # the upper left corner of the canvas, in canvas coordinates
+        corner = canvas.invert([[0, 0]])[0]
+        self.item = canvas.image(corner, self.image, anchor=NW, tags="slime")
+
+    def rgba(self, color):
+        """Looks up a color; returns r, g, b, a bytes."""
+        try:
+            return self.colors[color]
+        except KeyError:
+            rgb = [x // 257 for x in self.canvas.winfo_rgb(color)]
+            self.colors[color] = value = bytes(rgb + [255])
+            return value
+
+    def fill_polygon(self, coords, color):
+        """Fills a polygon, given in canvas coordinates.
+
+        Fills the pixels whose centers are inside, one row at a time,
+        and schedules a flush.
+        """
+        points = self.canvas.trans(coords)
+        edges = list(zip(points, points[1:] + points[:1]))
+        ys = [y for x, y in points]
+        row1 = max(int(math.ceil(min(ys) - 0.5)), 0)
+        row2 = min(int(math.floor(max(ys) - 0.5)), self.height - 1)
+        width = self.width
+        pixels = self.pixels
+        rgba = self.rgba(color)
+        left, right = width, 0
+
+        for row in range(row1, row2 + 1):
+            yc = row + 0.5
+            xs = []
+            for (x1, y1), (x2, y2) in edges:
+                if (y1 <= yc) != (y2 <= yc):
+                    xs.append(x1 + (yc - y1) * (x2 - x1) / (y2 - y1))
+            xs.sort()
+            for xa, xb in zip(xs[::2], xs[1::2]):
+                col1 = max(int(math.ceil(xa - 0.5)), 0)
+                col2 = min(int(math.floor(xb - 0.5)) + 1, width)
+                if col1 < col2:
+                    i = 4 * (row * width + col1)
+                    pixels[i : i + 4 * (col2 - col1)] = rgba * (col2 - col1)
+                    left = min(left, col1)
+                    right = max(right, col2)
+
+        if left < right:
+            self.touch(left, row1, right, row2 + 1)
+
+    def touch(self, col1, row1, col2, row2):
+        """Adds a rectangle of pixels to the ones the next flush copies."""
+        if self.bbox is None:
+            self.bbox = [col1, row1, col2, row2]
+            self.gui.after_idle(self.flush)
+            return
+        bbox = self.bbox
+        bbox[0] = min(bbox[0], col1)
+        bbox[1] = min(bbox[1], row1)
+        bbox[2] = max(bbox[2], col2)
+        bbox[3] = max(bbox[3], row2)
+
+    def flush(self):
+        """Copies the pixels that changed into the image, with one put."""
+        if self.bbox is None:
+            return
+        col1, row1, col2, row2 = self.bbox
+        self.bbox = None
+
+        width = self.width
+        rows = [
+            self.pixels[4 * (row * width + col1) : 4 * (row * width + col2)]
+            for row in range(row1, row2)
+        ]
+        data = png_data(col2 - col1, row2 - row1, b"".join(rows), alpha=True)
+        self.image.put(base64.b64encode(data).decode("ascii"), to=(col1, row1))
+
+    def clear(self):
+        """Removes all the slime."""
+        self.pixels = bytearray(4 * self.width * self.height)
+        self.bbox = None
+        self.image.blank()
+
+
+class Trajectory(object):
+    """Positions sampled at a fixed time step, starting at t=0.
+
+    Attributes:
+        dt: time step in seconds
+        xs, ys: arrays of coordinates; sample i is at time i * dt
+    """
+
+    def __init__(self, dt, xs, ys):
+        self.dt = dt
+        self.xs = array.array("d", xs)
+        self.ys = array.array("d", ys)
+
+    def __len__(self):
+        return len(self.xs)
+
+    @property
+    def end(self):
+        """Time of the last sample."""
+        return (len(self.xs) - 1) * self.dt
+
+    def index(self, t):
+        """Returns the index of the sample nearest time t."""
+        i = int(round(t / self.dt))
+        return min(max(i, 0), len(self.xs) - 1)
+
+    def position(self, t):
+        """Returns the sampled (x, y) nearest time t."""
+        i = self.index(t)
+        return self.xs[i], self.ys[i]
+
+    def write(self, filename):
+        """Writes the samples to a CSV file with columns t, x and y."""
+        fp = open(filename, "w", newline="")
+        writer = csv.writer(fp)
+        writer.writerow(["t", "x", "y"])
+        for i, (x, y) in enumerate(zip(self.xs, self.ys)):
+            writer.writerow([i * self.dt, x, y])
+        fp.close()
+
+
+def make_function(source):
+    """Compiles an expression in t into a function of t.
+
+    The expression is evaluated in this module's namespace, so it
+    can use math and random.
+    """
+    code = compile("lambda t: (%s)" % source.strip(), "<%s>" % source, "eval")
+    return eval(code, globals())
 
 
 class Amoeba(Animal):
@@ -154,6 +459,9 @@ class Amoeba(Animal):
         color2 = color of the nucleus
     """
 
+    # thetas is the sequence of angles used to compute the perimeter
+    thetas = tuple(range(0, 360, 30))
+
     def __init__(self, world=None):
         Animal.__init__(self, world)
 
@@ -172,14 +480,13 @@ class Amoeba(Animal):
     def draw(self):
         """Draws the Amoeba."""
 
-        # thetas is the sequence of angles used to compute the perimeter
-        thetas = list(range(0, 360, 30))
+        thetas = self.thetas
         coords = self.poly_coords(self.x, self.y, thetas, self.size)
 
         slime = "lavender"
 
         # draw the slime outline which will be left behind
-        self.world.canvas.polygon(coords, fill=slime, outline=slime, tags="slime")
+        self.world.slime.fill_polygon(coords, slime)
 
         # draw the outer perimeter
         self.world.canvas.polygon(
@@ -200,9 +507,10 @@ class Amoeba(Animal):
             thetas: sequence of angles
             size: minimum radius; actual radius is up to 2x bigger
         """
-        rs = [size + random.uniform(0, size) for theta in thetas]
-        coords = [self.polar(x, y, r, theta) for (r, theta) in zip(rs, thetas)]
-        return coords
+        template = self.template(tuple(thetas))
+        rand = random.random
+        rs = [size + size * rand() for unit in template]
+        return self.shape(x, y, template, rs)
 
 
 if __name__ == "__main__":
@@ -6,20 +6,58 @@ Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
 """
 
 import math
+import weakref
+
+from tkinter import NW
+
 from .World import World
 
 
 class CellWorld(World):
-    """Contains cells and animals that move between cells."""
+    """Contains cells and animals that move between cells.
+
+    Attributes:
+        cells: map from index tuples to Cell objects
+        cell_grid: CellGrid or TiledGrid that holds the cells, or None if
+                   the cells are stored in a dictionary.
+    """
+
+    def __init__(
+        self,
+        canvas_size=500,
+        cell_size=5,
+        interactive=False,
+        grid_size=None,
+        tile_size=None,
+        backend=None,
+    ):
+        """Makes a CellWorld.
 
-    def __init__(self, canvas_size=500, cell_size=5, interactive=False):
-        World.__init__(self)
+        Args:
+            canvas_size: width and height of the canvas in pixels
+            cell_size: width and height of a cell in pixels
+            interactive: boolean, whether to make the control panel
+            grid_size: if provided, the cells are kept in a CellGrid
+                       with the given (width, height) or width,
+                       rather than a dictionary of Cell objects.
+            tile_size: if provided (and grid_size is not), the cells
+                       are kept in an unbounded TiledGrid with tiles
+                       of the given size.
+            backend: "tk" or "headless"; see Gui
+        """
+        World.__init__(self, backend=backend)
         self.title("CellWorld")
         self.canvas_size = canvas_size
         self.cell_size = cell_size
 
         # cells is a map from index tuples to Cell objects
         self.cells = {}
+        self.cell_grid = None
+        self.grid_image = None
+        if grid_size is not None:
+            self.make_grid(grid_size)
+        elif tile_size is not None:
+            self.make_tiled_grid(tile_size)
 
         if interactive:
             self.make_canvas()
@@ -33,6 +71,8 @@ class CellWorld(World):
             bg="white",
             scale=[self.cell_size, self.cell_size],
         )
+        if self.cell_grid is not None:
+            self.draw_grid()
 
     def make_control(self):
         """Adds GUI elements that allow the user to change the scale."""
@@ -60,14 +100,85 @@ class CellWorld(World):
         i, j = int(math.floor(x)), int(math.floor(y))
 
         # toggle the cell if it exists; create it otherwise
+        # (a CellGrid already contains every cell it can hold)
         cell = self.get_cell(i, j)
         if cell:
             cell.toggle()
-        else:
+        elif self.cell_grid is None:
             self.make_cell(x, y)
+        self.flush()
+
+    def make_grid(self, grid_size, origin=None):
+        """Replaces the cells with a CellGrid of the given size.
+
+        Args:
+            grid_size: (width, height) tuple or int width and height
+            origin: indices of the lower-left cell; by default the
+                    grid is centered on the origin.
+
+        Returns:
+            CellGrid
+        """
+        if isinstance(grid_size, int):
+            grid_size = grid_size, grid_size
+        width, height = grid_size
+        return self.set_grid(CellGrid(self, width, height, origin))
+
+    def make_tiled_grid(self, tile_size=64):
+        """Replaces the cells with an unbounded TiledGrid.
+
+        Args:
+            tile_size: width and height of the tiles
+
+        Returns:
+            TiledGrid
+        """
+        return self.set_grid(TiledGrid(self, tile_size))
+
+    def set_grid(self, grid):
+        """Uses the given CellGrid or TiledGrid to hold the cells."""
+        self.cell_grid = grid
+        self.cells = grid
+        if getattr(self, "canvas", None) is not None:
+            self.draw_grid()
+        return grid
+
+    def draw_grid(self):
+        """Draws the cells in the grid as images on the canvas."""
+        if self.grid_image is not None:
+            self.grid_image.undraw()
+        self.grid_image = self.cell_grid.make_image(self.canvas)
+        self.grid_image.draw(self.cell_size)
+
+    def flush(self):
+        """Draws the cells in the CellGrid that changed since the last flush.
+
+        Cells that are not in a CellGrid are drawn as they change,
+        so there is nothing to flush.
+        """
+        if self.grid_image is not None:
+            self.grid_image.flush()
+
+    def step(self):
+        """Invokes step on every animal, then flushes the changed cells."""
+        World.step(self)
+        self.flush()
+
+    def advance(self, n):
+        """Takes n steps (see World.advance), then flushes the changed
+        cells once."""
+        running = self.running
+        for i in range(n):
+            World.step(self)
+            if running and not self.running:
+                break
+        self.flush()
 
     def make_cell(self, i, j):
         """Creates and returns a new cell at i,j."""
+        if self.cell_grid is not None:
+            return self.cell_grid.make_cell(i, j)
+
         cell = Cell(self, i, j)
         self.cells[i, j] = cell
         return cell
@@ -108,6 +219,46 @@ class CellWorld(World):
         cells = [self.get_cell(i + di, j + dj, default) for di, dj in deltas]
         return cells
 
+    def get_neighbor_counts(self, deltas=None, region=None, wrap=False):
+        """Counts the marked neighbors of every cell in one call.
+
+        Precondition: the world has a CellGrid (see make_grid).
+
+        Args:
+            deltas: list of tuple offsets; default is eight_neighbors
+            region: (i, j, width, height) tuple that selects a block of
+                    cells; default is the whole grid
+            wrap: boolean, whether the grid wraps around at the edges
+
+        Returns:
+            bytearray of counts in row-major order
+        """
+        if self.cell_grid is None:
+            raise ValueError("get_neighbor_counts requires a CellGrid.")
+        if deltas is None:
+            deltas = CellWorld.eight_neighbors
+        return self.cell_grid.neighbor_counts(deltas, region, wrap)
+
+    def get_neighbor_states(self, deltas=None, region=None, wrap=False):
+        """Gets the state of each neighbor of every cell in one call.
+
+        Precondition: the world has a CellGrid (see make_grid).
+
+        Args:
+            deltas: list of tuple offsets; default is eight_neighbors
+            region: (i, j, width, height) tuple that selects a block of
+                    cells; default is the whole grid
+            wrap: boolean, whether the grid wraps around at the edges
+
+        Returns:
+            list of bytearrays, one for each delta, in row-major order
+        """
+        if self.cell_grid is None:
+            raise ValueError("get_neighbor_states requires a CellGrid.")
+        if deltas is None:
+            deltas = CellWorld.eight_neighbors
+        return self.cell_grid.neighbor_states(deltas, region, wrap)
+
     def rescale(self):
         """Event handler that rescales the world.
 
@@ -115,18 +266,32 @@ class CellWorld(World):
         changes the canvas transform, and redraws the world.
         """
         cell_size = self.cell_size_en.get()
-        cell_size = int(cell_size)
-        self.canvas.transforms[0].scale = [cell_size, cell_size]
+        self.cell_size = int(cell_size)
+        self.canvas.transforms[0].scale = [self.cell_size, self.cell_size]
         self.redraw()
 
     def redraw(self):
         """Clears the canvas and redraws all cells and animals."""
         self.canvas.clear()
-        for cell in self.cells.values():
-            cell.draw()
+        if self.cell_grid is None:
+            for cell in self.cells.values():
+                cell.draw()
+        else:
+            self.draw_grid()
         for animal in self.animals:
             animal.draw()
 
+    def clear_cells(self):
+        """Undraws and removes all the cells."""
+        if self.cell_grid is not None:
+            self.cell_grid.clear()
+            self.flush()
+            return
+
+        for cell in list(self.cells.values()):
+            cell.undraw()
+        self.cells = {}
+
 
 class Cell(object):
     """A rectangular region in CellWorld"""
@@ -143,6 +308,7 @@ class Cell(object):
         self.unmarked_options = dict(fill="yellow", outline="gray80")
 
         self.marked = False
+        self.state = 0
         self.draw()
 
     def draw(self):
@@ -174,17 +340,36 @@ class Cell(object):
     def mark(self):
         """Marks this cell."""
         self.marked = True
+        self.state = 1
         self.config(**self.marked_options)
 
     def unmark(self):
         """Unmarks this cell."""
         self.marked = False
+        self.state = 0
         self.config(**self.unmarked_options)
 
     def is_marked(self):
         """Checks whether this cell is marked."""
         return self.marked
 
+    def get_state(self):
+        """Returns the state of this cell: 0 is unmarked, 1 is marked,
+        and other states come from set_state."""
+        return self.state
+
+    def set_state(self, state):
+        """Marks this cell if state is nonzero; unmarks it otherwise.
+
+        The cell remembers the state, so rules can use more than two,
+        but all nonzero states are drawn as marked.
+        """
+        if state:
+            self.mark()
+        else:
+            self.unmark()
+        self.state = state
+
     def toggle(self):
         """Toggles the state of this cell."""
         if self.is_marked():
@@ -193,6 +378,816 @@ class Cell(object):
             self.mark()
 
 
+# maps every nonzero state to 1, so a translated state array has a 1
+# wherever a cell is marked
+MARKED = bytes([0] + [1] * 255)
+
+
+class CellGrid(object):
+    """A rectangular block of cells with states packed into a bytearray.
+
+    A CellGrid behaves like the dictionary CellWorld normally uses to
+    map from index tuples to cells, but it stores one byte per cell.
+    Cell objects are created on demand as GridCell views, and they are
+    not drawn on the canvas.
+
+    Every cell in the grid exists; get returns the default value only
+    for indices outside the grid.
+
+    Attributes:
+        world: CellWorld
+        width, height: number of cells in each direction
+        i0, j0: indices of the lower-left cell
+        state: bytearray of cell states in row-major order (all the
+               cells with the same j are contiguous); 0 is unmarked,
+               1 is marked, and other values are drawn with the
+               fill color in colors.
+        dirty: set of offsets of cells that need repainting
+        rescan: True if state was changed directly, without recording
+                the offsets in dirty; then the image compares every cell
+    """
+
+    def __init__(self, world, width, height, origin=None):
+        self.world = world
+        self.width = width
+        self.height = height
+        if origin is None:
+            origin = -(width // 2), -(height // 2)
+        self.i0, self.j0 = origin
+        self.state = bytearray(width * height)
+
+        # fill colors for states other than 0 (unmarked) and 1 (marked)
+        self.colors = {}
+
+        # options shared by all the views
+        self.marked_options = dict(fill="black", outline="gray80")
+        self.unmarked_options = dict(fill="yellow", outline="gray80")
+
+        # options configured for individual cells, and the offsets
+        # of cells whose state or options changed since the last flush
+        self.options = {}
+        self.dirty = set()
+        self.rescan = False
+
+        # views that are still in use, so that get_cell keeps
+        # returning the same object for the same cell
+        self.views = weakref.WeakValueDictionary()
+
+    def index(self, i, j):
+        """Returns the offset of cell i, j in self.state, or -1."""
+        i -= self.i0
+        j -= self.j0
+        if 0 <= i < self.width and 0 <= j < self.height:
+            return j * self.width + i
+        return -1
+
+    def contains(self, i, j):
+        """Checks whether i, j is inside the grid."""
+        return self.index(i, j) != -1
+
+    def get_state(self, i, j):
+        """Returns the state of the cell at i, j."""
+        k = self.index(i, j)
+        if k == -1:
+            raise IndexError("cell %s is outside the grid" % str((i, j)))
+        return self.state[k]
+
+    def set_state(self, i, j, state):
+        """Sets the state of the cell at i, j."""
+        k = self.index(i, j)
+        if k == -1:
+            raise IndexError("cell %s is outside the grid" % str((i, j)))
+        self.state[k] = state
+        self.dirty.add(k)
+
+    def get(self, indices, default=None):
+        """Returns a view of the cell with the given indices, or default."""
+        view = self.views.get(indices)
+        if view is not None:
+            return view
+        if self.index(*indices) == -1:
+            return default
+        view = GridCell(self, *indices)
+        self.views[indices] = view
+        return view
+
+    def make_cell(self, i, j):
+        """Resets the cell at i, j to unmarked and returns a view of it."""
+        self.set_state(i, j, 0)
+        self.clear_options(i, j)
+        return self.get((i, j))
+
+    def set_options(self, i, j, **options):
+        """Configures the cell at i, j with the given options."""
+        self.options.setdefault((i, j), {}).update(options)
+        self.dirty.add(self.index(i, j))
+
+    def clear_options(self, i, j):
+        """Removes the options configured for the cell at i, j."""
+        if self.options.pop((i, j), None) is not None:
+            self.dirty.add(self.index(i, j))
+
+    def get_fill(self, k):
+        """Returns the fill color of the cell at offset k."""
+        if self.options:
+            j, i = divmod(k, self.width)
+            options = self.options.get((i + self.i0, j + self.j0))
+            if options and "fill" in options:
+                return options["fill"]
+        state = self.state[k]
+        if state == 0:
+            return self.unmarked_options["fill"]
+        if state in self.colors:
+            return self.colors[state]
+        return self.marked_options["fill"]
+
+    def clear(self):
+        """Unmarks all cells."""
+        self.state[:] = bytes(len(self.state))
+        self.rescan = True
+        for i, j in self.options:
+            self.dirty.add(self.index(i, j))
+        self.options = {}
+
+    def __getitem__(self, indices):
+        cell = self.get(indices)
+        if cell is None:
+            raise KeyError(indices)
+        return cell
+
+    def __contains__(self, indices):
+        return self.index(*indices) != -1
+
+    def __len__(self):
+        return len(self.state)
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        """Iterates the indices of all cells, row by row."""
+        for j in range(self.j0, self.j0 + self.height):
+            for i in range(self.i0, self.i0 + self.width):
+                yield i, j
+
+    def values(self):
+        """Iterates views of all cells."""
+        for indices in self.keys():
+            yield self.get(indices)
+
+    def items(self):
+        """Iterates (indices, view) pairs."""
+        for indices in self.keys():
+            yield indices, self.get(indices)
+
+    def padded(self, margin, wrap=False):
+        """Returns a copy of self.state surrounded by a margin.
+
+        Args:
+            margin: number of cells to add on each side
+            wrap: boolean, whether to fill the margin with cells from
+                  the opposite edge; otherwise it is filled with 0
+
+        Returns:
+            bytearray of rows with width + 2 * margin cells
+        """
+        w, h, m = self.width, self.height, margin
+        if m == 0:
+            return bytearray(self.state)
+
+        # when wrapping, each row is repeated enough times to cover
+        # the margins, then sliced
+        reps = m // w + 1
+        start = reps * w - m
+        blank = bytes(w + 2 * m)
+
+        rows = []
+        for j in range(-m, h + m):
+            if not wrap and not 0 <= j < h:
+                rows.append(blank)
+                continue
+            k = (j % h) * w
+            row = self.state[k : k + w]
+            if wrap:
+                row = (row * (2 * reps + 1))[start : start + w + 2 * m]
+            else:
+                row = blank[:m] + row + blank[:m]
+            rows.append(row)
+        return bytearray(b"".join(rows))
+
+    def check_region(self, region):
+        """Converts a region to offsets relative to the lower-left cell.
+
+        Args:
+            region: (i, j, width, height) tuple or None for the whole grid
+
+        Returns:
+            (i, j, width, height) tuple of offsets
+        """
+        if region is None:
+            return 0, 0, self.width, self.height
+
+        i, j, width, height = region
+        i -= self.i0
+        j -= self.j0
+        if i < 0 or j < 0 or i + width > self.width or j + height > self.height:
+            raise IndexError("region %s is outside the grid" % str(region))
+        return i, j, width, height
+
+    def crop(self, padded, margin, region):
+        """Extracts a region from a padded array.
+
+        Args:
+            padded: bytearray with the layout returned by padded
+            margin: the margin used to make padded
+            region: (i, j, width, height) tuple of offsets
+
+        Returns:
+            bytearray in row-major order
+        """
+        i, j, width, height = region
+        stride = self.width + 2 * margin
+        rows = []
+        for row in range(j + margin, j + margin + height):
+            k = row * stride + i + margin
+            rows.append(padded[k : k + width])
+        return bytearray(b"".join(rows))
+
+    def shifts(self, padded, margin, deltas):
+        """Generates a shifted copy of padded for each delta.
+
+        Each copy is an integer with one byte per cell; the byte at
+        the offset of a cell is the value of its neighbor at (di, dj).
+
+        Shifting a big integer moves every byte at once, which is
+        much faster than indexing each cell in Python.
+        """
+        stride = self.width + 2 * margin
+        n = int.from_bytes(padded, "little")
+        for di, dj in deltas:
+            offset = 8 * (dj * stride + di)
+            if offset >= 0:
+                yield n >> offset
+            else:
+                yield n << -offset
+
+    def neighbor_counts(self, deltas, region=None, wrap=False):
+        """Counts the marked neighbors of the cells in a region.
+
+        See CellWorld.get_neighbor_counts.
+        """
+        if len(deltas) > 255:
+            raise ValueError("Too many deltas to count in a byte.")
+
+        region = self.check_region(region)
+        margin = max([max(abs(di), abs(dj)) for di, dj in deltas] + [0])
+        padded = self.padded(margin, wrap).translate(MARKED)
+
+        # the counts are less than 256, so the sum never carries
+        # from one byte to the next
+        total = sum(self.shifts(padded, margin, deltas))
+        size = len(padded)
+        total &= (1 << 8 * size) - 1
+        counts = total.to_bytes(size, "little")
+        return self.crop(counts, margin, region)
+
+    def neighbor_states(self, deltas, region=None, wrap=False):
+        """Gets the neighbor states of the cells in a region.
+
+        See CellWorld.get_neighbor_states.
+        """
+        region = self.check_region(region)
+        margin = max([max(abs(di), abs(dj)) for di, dj in deltas] + [0])
+        padded = self.padded(margin, wrap)
+
+        size = len(padded)
+        mask = (1 << 8 * size) - 1
+        res = []
+        for shifted in self.shifts(padded, margin, deltas):
+            states = (shifted & mask).to_bytes(size, "little")
+            res.append(self.crop(states, margin, region))
+        return res
+
+    def apply_rule(self, rule, deltas=None, wrap=False, states=2):
+        """Updates every cell based on its state and neighbor count.
+
+        For example, the rule for Conway's Game of Life is
+        lambda state, count: int(count == 3 or (state and count == 2))
+
+        Args:
+            rule: function that maps (state, count) to a new state
+            deltas: list of tuple offsets; default is eight_neighbors
+            wrap: boolean, whether the grid wraps around at the edges
+            states: number of possible cell states
+        """
+        if deltas is None:
+            deltas = CellWorld.eight_neighbors
+        n = len(deltas) + 1
+        if states * n > 256:
+            raise ValueError("Too many states and deltas for a byte table.")
+
+        # a larger state would carry into the next cell's byte
+        if self.state and max(self.state) >= states:
+            raise ValueError("Cell states must be less than states.")
+
+        # combine state and count into a single byte, then
+        # look up the new states with bytes.translate
+        table = bytearray(256)
+        for state in range(states):
+            for count in range(n):
+                table[state * n + count] = rule(state, count)
+
+        counts = self.neighbor_counts(deltas, None, wrap)
+        size = len(self.state)
+        key = int.from_bytes(self.state, "little") * n
+        key += int.from_bytes(counts, "little")
+        key = key.to_bytes(size, "little")
+        self.state[:] = key.translate(table)
+        self.rescan = True
+
+    def make_image(self, canvas):
+        """Makes an object that draws this grid on the canvas."""
+        return GridImage(self, canvas)
+
+    def marked(self):
+        """Iterates the indices of the marked cells."""
+        state = self.state.translate(MARKED)
+        width = self.width
+        k = state.find(1)
+        while k != -1:
+            j, i = divmod(k, width)
+            yield i + self.i0, j + self.j0
+            k = state.find(1, k + 1)
+
+
+class TiledGrid(object):
+    """An unbounded grid of cells, stored in square tiles.
+
+    Each tile is a CellGrid, allocated the first time a cell in it is
+    given a nonzero state or configured.  Reading a cell in a tile that
+    does not exist yet returns state 0 without allocating anything,
+    so memory use depends on how much of the plane has been written,
+    not how far apart the written cells are.
+
+    Like a CellGrid, a TiledGrid behaves like the dictionary CellWorld
+    normally uses; every cell exists, so get never returns the default.
+
+    Attributes:
+        world: CellWorld
+        tile_size: width and height of the tiles
+        tiles: map from tile index tuples to CellGrid objects
+    """
+
+    def __init__(self, world, tile_size=64):
+        self.world = world
+        self.tile_size = tile_size
+        self.tiles = {}
+
+        # these are shared with all the tiles
+        self.marked_options = dict(fill="black", outline="gray80")
+        self.unmarked_options = dict(fill="yellow", outline="gray80")
+        self.colors = {}
+        self.options = {}
+
+        self.views = weakref.WeakValueDictionary()
+
+    def get_tile(self, i, j, create=False):
+        """Returns the tile that contains cell i, j.
+
+        Args:
+            i, j: cell indices
+            create: boolean, whether to allocate the tile if necessary
+
+        Returns:
+            CellGrid or None if the tile does not exist
+        """
+        n = self.tile_size
+        key = i // n, j // n
+        tile = self.tiles.get(key)
+        if tile is None and create:
+            tile = CellGrid(self.world, n, n, (key[0] * n, key[1] * n))
+            tile.marked_options = self.marked_options
+            tile.unmarked_options = self.unmarked_options
+            tile.colors = self.colors
+            tile.options = self.options
+            self.tiles[key] = tile
+        return tile
+
+    def contains(self, i, j):
+        """Every cell is inside a TiledGrid."""
+        return True
+
+    def get_state(self, i, j):
+        """Returns the state of the cell at i, j."""
+        tile = self.get_tile(i, j)
+        if tile is None:
+            return 0
+        return tile.state[(j - tile.j0) * tile.width + i - tile.i0]
+
+    def set_state(self, i, j, state):
+        """Sets the state of the cell at i, j."""
+        tile = self.get_tile(i, j, create=bool(state))
+        if tile is not None:
+            tile.set_state(i, j, state)
+
+    def get(self, indices, default=None):
+        """Returns a view of the cell with the given indices."""
+        view = self.views.get(indices)
+        if view is None:
+            view = GridCell(self, *indices)
+            self.views[indices] = view
+        return view
+
+    def make_cell(self, i, j):
+        """Resets the cell at i, j to unmarked and returns a view of it."""
+        self.set_state(i, j, 0)
+        self.clear_options(i, j)
+        return self.get((i, j))
+
+    def set_options(self, i, j, **options):
+        """Configures the cell at i, j with the given options."""
+        self.get_tile(i, j, create=True).set_options(i, j, **options)
+
+    def clear_options(self, i, j):
+        """Removes the options configured for the cell at i, j."""
+        tile = self.get_tile(i, j)
+        if tile is not None:
+            tile.clear_options(i, j)
+
+    def clear(self):
+        """Removes all the tiles."""
+        self.tiles = {}
+        self.options.clear()
+
+    def memory_usage(self):
+        """Returns the number of bytes used to store cell states."""
+        return len(self.tiles) * self.tile_size ** 2
+
+    def bounds(self):
+        """Returns (i, j, width, height) of the block of allocated tiles."""
+        if not self.tiles:
+            return 0, 0, 0, 0
+        n = self.tile_size
+        tis = [ti for ti, tj in self.tiles]
+        tjs = [tj for ti, tj in self.tiles]
+        i, j = min(tis) * n, min(tjs) * n
+        return i, j, (max(tis) + 1) * n - i, (max(tjs) + 1) * n - j
+
+    def extract(self, i, j, width, height):
+        """Copies a block of cells into a new CellGrid.
+
+        Args:
+            i, j: indices of the lower-left cell
+            width, height: size of the block
+
+        Returns:
+            CellGrid
+        """
+        grid = CellGrid(self.world, width, height, (i, j))
+        for tile in self.tiles.values():
+            # find the overlap of the tile and the block
+            i1, i2 = max(i, tile.i0), min(i + width, tile.i0 + tile.width)
+            j1, j2 = max(j, tile.j0), min(j + height, tile.j0 + tile.height)
+            if i1 >= i2:
+                continue
+            for jj in range(j1, j2):
+                src = (jj - tile.j0) * tile.width - tile.i0
+                dest = (jj - j) * width - i
+                grid.state[dest + i1 : dest + i2] = tile.state[src + i1 : src + i2]
+        return grid
+
+    def neighbor_counts(self, deltas, region=None, wrap=False):
+        """Counts the marked neighbors of the cells in a region.
+
+        See CellWorld.get_neighbor_counts; the default region is the
+        block of allocated tiles.
+        """
+        grid, region = self.extract_region(deltas, region, wrap)
+        return grid.neighbor_counts(deltas, region)
+
+    def neighbor_states(self, deltas, region=None, wrap=False):
+        """Gets the neighbor states of the cells in a region.
+
+        See CellWorld.get_neighbor_states; the default region is the
+        block of allocated tiles.
+        """
+        grid, region = self.extract_region(deltas, region, wrap)
+        return grid.neighbor_states(deltas, region)
+
+    def extract_region(self, deltas, region, wrap):
+        """Copies a region and the neighbors of its cells into a CellGrid.
+
+        Returns:
+            (CellGrid, region) tuple
+        """
+        if wrap:
+            raise ValueError("A TiledGrid has no edges to wrap around.")
+        if region is None:
+            region = self.bounds()
+        i, j, width, height = region
+        m = max([max(abs(di), abs(dj)) for di, dj in deltas] + [0])
+        grid = self.extract(i - m, j - m, width + 2 * m, height + 2 * m)
+        return grid, region
+
+    def make_image(self, canvas):
+        """Makes an object that draws the visible tiles on the canvas."""
+        return TiledImage(self, canvas)
+
+    def __getitem__(self, indices):
+        return self.get(indices)
+
+    def __contains__(self, indices):
+        return True
+
+    def __len__(self):
+        """Returns the number of cells in the allocated tiles."""
+        return len(self.tiles) * self.tile_size ** 2
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        """Iterates the indices of the cells in the allocated tiles."""
+        for tile in list(self.tiles.values()):
+            for indices in tile.keys():
+                yield indices
+
+    def values(self):
+        """Iterates views of the cells in the allocated tiles."""
+        for indices in self.keys():
+            yield self.get(indices)
+
+    def items(self):
+        """Iterates (indices, view) pairs."""
+        for indices in self.keys():
+            yield indices, self.get(indices)
+
+    def marked(self):
+        """Iterates the indices of the marked cells."""
+        for tile in list(self.tiles.values()):
+            for indices in tile.marked():
+                yield indices
+
+
+class GridCell(Cell):
+    """A view of one cell in a CellGrid or TiledGrid.
+
+    Provides the same interface as Cell, but the state lives in the
+    grid, so views can be created and discarded freely.
+    """
+
+    def __init__(self, grid, i, j):
+        self.grid = grid
+        self.world = grid.world
+        self.indices = i, j
+        self.marked_options = grid.marked_options
+        self.unmarked_options = grid.unmarked_options
+        self.item = None
+
+    @property
+    def bounds(self):
+        return self.world.cell_bounds(*self.indices)
+
+    def get_marked(self):
+        return self.grid.get_state(*self.indices) != 0
+
+    def set_marked(self, marked):
+        self.grid.set_state(*self.indices, int(bool(marked)))
+
+    marked = property(get_marked, set_marked)
+
+    def get_state(self):
+        """Returns the state of this cell."""
+        return self.grid.get_state(*self.indices)
+
+    def set_state(self, state):
+        """Sets the state of this cell."""
+        self.grid.clear_options(*self.indices)
+        self.grid.set_state(*self.indices, state)
+
+    def draw(self):
+        """Cells in a CellGrid are not drawn individually."""
+
+    def undraw(self):
+        """Cells in a CellGrid are not drawn individually."""
+
+    def get_config(self, option):
+        """Gets the configuration of this cell."""
+        options = self.grid.options.get(self.indices, {})
+        if option in options:
+            return options[option]
+        if self.marked:
+            return self.marked_options[option]
+        return self.unmarked_options[option]
+
+    def config(self, **options):
+        """Configure this cell with the given options."""
+        self.grid.set_options(*self.indices, **options)
+
+    def mark(self):
+        """Marks this cell."""
+        self.grid.clear_options(*self.indices)
+        self.marked = True
+
+    def unmark(self):
+        """Unmarks this cell."""
+        self.grid.clear_options(*self.indices)
+        self.marked = False
+
+
+class GridImage(object):
+    """Draws a CellGrid as one image item on a canvas.
+
+    Instead of making a rectangle item for each cell, GridImage draws
+    one pixel per cell and zooms the image.  When the world flushes,
+    it repaints only the cells the grid marked dirty, combining
+    adjacent cells of the same color into a single PhotoImage.put.
+    If the state was changed in bulk (see CellGrid.rescan), it finds
+    the changed cells by comparing the grid with a copy of the states
+    it has drawn.
+
+    Only the fill option is drawn; cells in the image have no outline.
+    """
+
+    def __init__(self, grid, canvas):
+        self.grid = grid
+        self.canvas = canvas
+        self.image = None
+        self.item = None
+        self.drawn = None
+        self.cell_size = 1
+
+        # map from color names to #rrggbb pixel values
+        self.pixels = {}
+
+    def pixel(self, color):
+        """Converts a color name to a #rrggbb pixel value."""
+        pixel = self.pixels.get(color)
+        if pixel is None:
+            r, g, b = self.canvas.winfo_rgb(color)
+            pixel = "#%02x%02x%02x" % (r >> 8, g >> 8, b >> 8)
+            self.pixels[color] = pixel
+        return pixel
+
+    def draw(self, cell_size):
+        """Draws every cell; used initially and after the scale changes."""
+        grid = self.grid
+        self.cell_size = cell_size
+        image = self.canvas.photo_image(width=grid.width, height=grid.height)
+
+        # the image is built from the top row down, so j decreases
+        width = grid.width
+        rows = []
+        for j in reversed(range(grid.height)):
+            offsets = range(j * width, (j + 1) * width)
+            pixels = [self.pixel(grid.get_fill(k)) for k in offsets]
+            rows.append("{%s}" % " ".join(pixels))
+        image.put(" ".join(rows))
+
+        # flush paints cells at full size, so the zoomed copy is kept
+        if cell_size > 1:
+            image = image.zoom(cell_size)
+        self.image = image
+
+        # the upper-left corner of the image is the upper-left
+        # corner of the top-left cell
+        coord = [grid.i0, grid.j0 + grid.height]
+        self.item = self.canvas.image(coord, self.image, anchor=NW)
+
+        self.drawn = bytearray(grid.state)
+        grid.dirty.clear()
+        grid.rescan = False
+
+    def undraw(self):
+        """Deletes the image item."""
+        if self.item is not None:
+            self.item.delete()
+            self.item = None
+
+    def changed(self):
+        """Returns a sorted list of offsets of cells that need repainting."""
+        grid = self.grid
+        changed = set(grid.dirty)
+        if not grid.rescan:
+            return sorted(changed)
+
+        size = len(grid.state)
+        diff = int.from_bytes(grid.state, "little")
+        diff ^= int.from_bytes(self.drawn, "little")
+        if diff:
+            diff = diff.to_bytes(size, "little").translate(MARKED)
+            k = diff.find(1)
+            while k != -1:
+                changed.add(k)
+                k = diff.find(1, k + 1)
+        return sorted(changed)
+
+    def flush(self):
+        """Repaints the cells that changed since the last draw or flush."""
+        grid = self.grid
+        changed = self.changed()
+        if not changed:
+            grid.rescan = False
+            return
+
+        # group the changed cells into horizontal runs with the same color
+        width = grid.width
+        run = []
+        for k in changed:
+            color = grid.get_fill(k)
+            if run and (k != run[-1][0] + 1 or k % width == 0 or color != run[-1][1]):
+                self.put_run(run)
+                run = []
+            run.append((k, color))
+        self.put_run(run)
+
+        if grid.rescan:
+            self.drawn[:] = grid.state
+        else:
+            drawn, state = self.drawn, grid.state
+            for k in changed:
+                drawn[k] = state[k]
+        grid.dirty.clear()
+        grid.rescan = False
+
+    def put_run(self, run):
+        """Fills a horizontal run of cells with a color.
+
+        Args:
+            run: list of (offset, color) pairs for adjacent cells
+        """
+        first, color = run[0]
+        last = run[-1][0]
+        j, i1 = divmod(first, self.grid.width)
+        i2 = last - j * self.grid.width + 1
+
+        # convert to pixels in the image, where y increases downward
+        cs = self.cell_size
+        y1 = (self.grid.height - j - 1) * cs
+        self.image.put(self.pixel(color), to=(i1 * cs, y1, i2 * cs, y1 + cs))
+
+
+class TiledImage(object):
+    """Draws the tiles of a TiledGrid that are visible on a canvas.
+
+    Each visible tile is drawn by a GridImage; tiles outside the
+    canvas are not drawn at all.
+    """
+
+    def __init__(self, grid, canvas):
+        self.grid = grid
+        self.canvas = canvas
+        self.cell_size = 1
+
+        # map from tile index tuples to GridImages
+        self.images = {}
+
+    def visible(self):
+        """Returns the index tuples of the tiles that are on the canvas."""
+        n = self.grid.tile_size
+        corners = [[0, 0], [self.canvas.get_width(), self.canvas.get_height()]]
+        (x1, y1), (x2, y2) = self.canvas.invert(corners)
+        ti1, ti2 = sorted([int(math.floor(x1)) // n, int(math.floor(x2)) // n])
+        tj1, tj2 = sorted([int(math.floor(y1)) // n, int(math.floor(y2)) // n])
+        return [
+            (ti, tj) for ti in range(ti1, ti2 + 1) for tj in range(tj1, tj2 + 1)
+        ]
+
+    def draw(self, cell_size):
+        """Draws all the visible tiles."""
+        self.undraw()
+        self.cell_size = cell_size
+        self.flush()
+
+    def undraw(self):
+        """Deletes all the tile images."""
+        for image in self.images.values():
+            image.undraw()
+        self.images = {}
+
+    def flush(self):
+        """Repaints the visible cells that changed since the last flush."""
+        tiles = self.grid.tiles
+
+        # remove images of tiles that no longer exist
+        for key, image in list(self.images.items()):
+            if tiles.get(key) is not image.grid:
+                image.undraw()
+                del self.images[key]
+
+        for key in self.visible():
+            tile = tiles.get(key)
+            if tile is None:
+                continue
+            image = self.images.get(key)
+            if image is None:
+                image = GridImage(tile, self.canvas)
+                image.draw(self.cell_size)
+                self.images[key] = image
+            else:
+                image.flush()
+
+
 if __name__ == "__main__":
     world = CellWorld(interactive=True)
     world.bind()
@@ -0,0 +1,290 @@
+"""This module is part of Swampy, a suite of programs available from
+allendowney.com/swampy.
+
+Copyright 2010 Allen B. Downey
+Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
+
+Figure: a world where Turtles draw into an SVG or PNG file, with no GUI.
+
+    from swampy.TurtleWorld import *
+
+    fig = Figure('square.svg')
+    bob = Turtle(fig)
+    for i in range(4):
+        fd(bob, 100)
+        lt(bob)
+    fig.close()
+
+SvgCanvas and PngCanvas: the file writers.  They provide the line
+method of GuiCanvas, which is all a Turtle needs, and use the same
+coordinates: the origin is in the middle and y goes up.
+"""
+
+import os
+import struct
+import zlib
+
+from .World import World
+from .color_list import get_rgb
+
+
+class Figure(object):
+    """A world where Turtles draw into a file instead of on the screen.
+
+    Figure provides the parts of the World interface that Turtles
+    use.  The turtles themselves are not drawn, and the figure never
+    sleeps, so drawing takes only as long as the geometry.
+
+    Attributes:
+        canvas: SvgCanvas or PngCanvas the lines go to
+        animals: list of animals in the figure
+        exists: True until the figure is closed
+        delay: always 0
+    """
+
+    show_turtles = False
+
+    def __init__(self, filename, width=400, height=400, bg="white"):
+        """Makes a Figure; the type of file depends on the extension.
+
+        Args:
+            filename: name of an .svg or .png file
+            width, height: size of the image in pixels
+            bg: background color
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".svg":
+            self.canvas = SvgCanvas(filename, width, height, bg)
+        elif ext == ".png":
+            self.canvas = PngCanvas(filename, width, height, bg)
+        else:
+            raise ValueError("Figure can only make .svg and .png files.")
+
+        self.animals = []
+        self.exists = True
+        self.delay = 0
+
+        # animals made without a world go into this figure
+        World.current_world = self
+
+    def register(self, animal):
+        """Adds a new animal to the figure."""
+        self.animals.append(animal)
+
+    def unregister(self, animal):
+        """Removes an animal from the figure."""
+        self.animals.remove(animal)
+
+    def sleep(self):
+        """Does nothing; nobody is watching."""
+
+    def close(self):
+        """Draws any pending moves and finishes the file."""
+        if not self.exists:
+            return
+        for animal in self.animals:
+            if getattr(animal, "batched", False):
+                animal.draw_strokes()
+        self.canvas.close()
+        self.exists = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FigureCanvas(object):
+    """Parent class of SvgCanvas and PngCanvas.
+
+    Consecutive lines that join up and have the same options are
+    combined into one polyline before they are written.
+
+    Attributes:
+        filename: name of the output file
+        width, height: size in pixels
+        bg: background color
+        points: list of pixel coordinates of the pending polyline
+        options: tuple of (color, width) for the pending polyline
+    """
+
+    def __init__(self, filename, width, height, bg):
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.bg = bg
+        self.points = []
+        self.options = None
+
+    def pixel(self, point):
+        """Converts a point from canvas coordinates to pixels."""
+        x, y = point
+        return x + self.width / 2.0, self.height / 2.0 - y
+
+    def line(self, coords, fill="black", width=1, **options):
+        """Draws a polyline through the given points.
+
+        Only fill and width are used; other options are ignored.
+        """
+        points = [self.pixel(point) for point in coords]
+        key = fill, width
+        if self.points and key == self.options and points[0] == self.points[-1]:
+            self.points.extend(points[1:])
+            return
+
+        self.flush()
+        self.points = points
+        self.options = key
+
+    def flush(self):
+        """Writes the pending polyline, if there is one."""
+        if len(self.points) > 1:
+            color, width = self.options
+            self.draw_polyline(self.points, color, width)
+        self.points = []
+
+    def close(self):
+        """Writes the pending polyline and finishes the file."""
+        self.flush()
+        self.finish()
+
+    def draw_polyline(self, points, color, width):
+        """Writes a polyline.
+
+        Subclasses should override this method.
+        """
+        pass
+
+    def finish(self):
+        """Finishes the file.
+
+        Subclasses should override this method.
+        """
+        pass
+
+
+class SvgCanvas(FigureCanvas):
+    """Streams lines into an SVG file as they are drawn."""
+
+    def __init__(self, filename, width=400, height=400, bg="white"):
+        FigureCanvas.__init__(self, filename, width, height, bg)
+        self.fp = open(filename, "w")
+        self.fp.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+            'width="%d" height="%d">\n' % (width, height)
+        )
+        if bg:
+            self.fp.write(
+                '<rect width="100%%" height="100%%" fill="%s"/>\n' % svg_color(bg)
+            )
+
+    def draw_polyline(self, points, color, width):
+        coords = " ".join("%g,%g" % point for point in points)
+        self.fp.write(
+            '<polyline points="%s" stroke="%s" stroke-width="%g" fill="none"/>\n'
+            % (coords, svg_color(color), width)
+        )
+
+    def finish(self):
+        self.fp.write("</svg>\n")
+        self.fp.close()
+
+
+def svg_color(color):
+    """Converts a Tk color name to an SVG color."""
+    return "#%02x%02x%02x" % get_rgb(color)
+
+
+class PngCanvas(FigureCanvas):
+    """Draws lines into an RGB image and writes it as a PNG file.
+
+    Lines are one pixel wide, whatever their width, and they are not
+    antialiased.
+
+    Attributes:
+        pixels: bytearray of r, g, b values, row by row from the top
+    """
+
+    def __init__(self, filename, width=400, height=400, bg="white"):
+        FigureCanvas.__init__(self, filename, width, height, bg)
+        self.pixels = bytearray(get_rgb(bg or "white")) * (width * height)
+
+    def draw_polyline(self, points, color, width):
+        rgb = bytes(get_rgb(color))
+        pixels = [(int(round(x)), int(round(y))) for x, y in points]
+        for p1, p2 in zip(pixels, pixels[1:]):
+            self.draw_segment(p1, p2, rgb)
+
+    def draw_segment(self, p1, p2, rgb):
+        """Sets the pixels from p1 to p2 (Bresenham's algorithm)."""
+        x, y = p1
+        x2, y2 = p2
+        dx = abs(x2 - x)
+        dy = -abs(y2 - y)
+        sx = 1 if x < x2 else -1
+        sy = 1 if y < y2 else -1
+        err = dx + dy
+
+        width, height, pixels = self.width, self.height, self.pixels
+        while True:
+            if 0 <= x < width and 0 <= y < height:
+                k = 3 * (y * width + x)
+                pixels[k : k + 3] = rgb
+            if x == x2 and y == y2:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x += sx
+            if e2 <= dx:
+                err += dx
+                y += sy
+
+    def finish(self):
+        write_png(self.filename, self.width, self.height, self.pixels)
+
+
+def write_png(filename, width, height, pixels):
+    """Writes an 8-bit RGB image as a PNG file.
+
+    Args:
+        filename: string
+        width, height: size in pixels
+        pixels: bytes of r, g, b values, row by row from the top
+    """
+    fp = open(filename, "wb")
+    fp.write(png_data(width, height, pixels))
+    fp.close()
+
+
+def png_data(width, height, pixels, alpha=False):
+    """Encodes an 8-bit RGB or RGBA image in PNG format.
+
+    Args:
+        width, height: size in pixels
+        pixels: bytes of r, g, b (and a) values, row by row from the top
+        alpha: boolean, whether pixels has an alpha value for each pixel
+
+    Returns:
+        bytes
+    """
+    stride = (4 if alpha else 3) * width
+    raw = b"".join(
+        b"\0" + bytes(pixels[i : i + stride]) for i in range(0, len(pixels), stride)
+    )
+
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    color_type = 6 if alpha else 2
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", header),
+            chunk(b"IDAT", zlib.compress(raw)),
+            chunk(b"IEND", b""),
+        ]
+    )
@@ -35,6 +35,11 @@ Callable: the standard recipe from Python Cookbook for encapsulating
 a function and its arguments in an object that can be used as a
 callback.
 
+HeadlessCanvas, HeadlessWidget and friends: stand-ins for the Tk
+widgets, used when a Gui is created with backend="headless" (or the
+environment variable SWAMPY_BACKEND is "headless").  A headless Gui
+needs no display; its canvases record items in an in-memory scene.
+
 The most important idea in this module is using a stack of frames to
 avoid keeping track of parent widgets explicitly.
 
@@ -62,7 +67,9 @@ avoid keeping track of parent widgets explicitly.
 
 """
 
+import heapq
 import math
+import os
 import sys
 import tkinter
 import tkinter.font
@@ -70,6 +77,8 @@ import tkinter.font
 from tkinter import N, S, E, W
 from tkinter import TOP, BOTTOM, LEFT, RIGHT, END, ALL
 
+from .color_list import get_rgb
+
 
 class Gui(tkinter.Tk):
     """Provides wrappers for many of the methods in the Tk class.
@@ -79,22 +88,162 @@ class Gui(tkinter.Tk):
     explicitly.
     """
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, backend=None):
         """Initializes the gui.
 
         Turning on debugging changes the behavior of Gui.fr so
         that the nested frame structure is apparent.
 
+        Args:
+        backend: "tk" or "headless"; the default comes from the
+        environment variable SWAMPY_BACKEND, or "tk" if it is not set.
+
         Attributes:
         debug: is a boolean that makes Frames visible if True.
         frame: is the current Frame.
         frames: is the stack of pending Frames.
+        headless: is a boolean, True if there is no Tk interpreter.
         """
-        tkinter.Tk.__init__(self)
+        if backend is None:
+            backend = os.environ.get("SWAMPY_BACKEND", "tk")
+        if backend not in ["tk", "headless"]:
+            raise ValueError("Unknown backend: %s" % backend)
+
+        self.headless = backend == "headless"
+        if self.headless:
+            # there is no Tcl interpreter; setting tk keeps Tk.__getattr__
+            # from recursing when an attribute is missing
+            self.tk = None
+            self.headless_title = ""
+            self.protocols = {}
+            self.clock = 0
+            self.pending = []
+            self.next_after = 0
+            self.quitting = False
+        else:
+            tkinter.Tk.__init__(self)
+            # (IntVar, after id) for each wait in progress
+            self.waiting = []
         self.debug = debug
         self.frame = self
         self.frames = []
 
+    # the following methods override Tk methods so they also work
+    # without a Tk interpreter.  Headless callbacks scheduled by
+    # after run in virtual time, in milliseconds, so they do not wait.
+
+    def title(self, string=None):
+        """Sets or gets the title of the window."""
+        if not self.headless:
+            return tkinter.Tk.title(self, string)
+        if string is None:
+            return self.headless_title
+        self.headless_title = string
+
+    def protocol(self, name=None, func=None):
+        """Binds a callback to a window manager protocol."""
+        if not self.headless:
+            return tkinter.Tk.protocol(self, name, func)
+        self.protocols[name] = func
+
+    def after(self, ms, func=None, *args):
+        """Schedules func to be called after ms milliseconds."""
+        if not self.headless:
+            return tkinter.Tk.after(self, ms, func, *args)
+        self.next_after += 1
+        id = "after#%d" % self.next_after
+        heapq.heappush(self.pending, (self.clock + ms, self.next_after, id, func, args))
+        return id
+
+    def after_idle(self, func, *args):
+        """Schedules func to be called when there are no events to process."""
+        if not self.headless:
+            return tkinter.Tk.after_idle(self, func, *args)
+        return self.after(0, func, *args)
+
+    def after_cancel(self, id):
+        """Cancels a callback scheduled by after."""
+        if not self.headless:
+            return tkinter.Tk.after_cancel(self, id)
+        self.pending = [entry for entry in self.pending if entry[2] != id]
+        heapq.heapify(self.pending)
+
+    def run_next(self):
+        """Advances the virtual clock and runs the next headless callback."""
+        due, seq, id, func, args = heapq.heappop(self.pending)
+        self.clock = max(self.clock, due)
+        func(*args)
+
+    def wait(self, ms):
+        """Processes events for ms milliseconds, then returns.
+
+        Unlike time.sleep, this keeps the GUI responsive, and callbacks
+        scheduled with after keep running in the meantime.  When
+        headless, runs the callbacks that come due and advances the
+        virtual clock.
+
+        If the window is destroyed while waiting, returns right away.
+        """
+        if self.headless:
+            end = self.clock + ms
+            while self.pending and self.pending[0][0] <= end:
+                self.run_next()
+            self.clock = max(self.clock, end)
+            return
+
+        var = tkinter.IntVar(self)
+        entry = var, self.after(ms, var.set, 1)
+        self.waiting.append(entry)
+        try:
+            self.wait_variable(var)
+        finally:
+            self.waiting.remove(entry)
+
+    def update(self):
+        """Processes pending events.
+
+        When headless, runs the callbacks that are due now.
+        """
+        if not self.headless:
+            return tkinter.Tk.update(self)
+        due = [entry for entry in self.pending if entry[0] <= self.clock]
+        for i in range(len(due)):
+            self.run_next()
+
+    def update_idletasks(self):
+        """Processes pending idle events."""
+        if not self.headless:
+            return tkinter.Tk.update_idletasks(self)
+
+    def mainloop(self, n=0):
+        """Processes events until quit is invoked.
+
+        When headless, runs the scheduled callbacks until there
+        are none left.
+        """
+        if not self.headless:
+            return tkinter.Tk.mainloop(self, n)
+        self.quitting = False
+        while self.pending and not self.quitting:
+            self.run_next()
+
+    def quit(self):
+        """Exits the mainloop."""
+        if not self.headless:
+            return tkinter.Tk.quit(self)
+        self.quitting = True
+
+    def destroy(self):
+        """Destroys the window."""
+        if not self.headless:
+            # destroy deletes the callbacks that would end the waits
+            # in progress, so end them now
+            for var, id in self.waiting:
+                tkinter.Tk.after_cancel(self, id)
+                var.set(1)
+            return tkinter.Tk.destroy(self)
+        self.pending = []
+
     def pushfr(self, frame):
         """Pushes a frame onto the frame stack."""
         self.frames.append(self.frame)
@@ -113,6 +262,8 @@ class Gui(tkinter.Tk):
 
     def tl(self, **options):
         """Makes and returns a top level window."""
+        if self.headless:
+            return HeadlessWidget(**options)
         return tkinter.Toplevel(**options)
 
     def fr(self, *args, **options):
@@ -261,7 +412,10 @@ class Gui(tkinter.Tk):
         """Makes a menubutton"""
         underride(options, relief=tkinter.RAISED)
         mb = self.widget(tkinter.Menubutton, **options)
-        mb.menu = tkinter.Menu(mb, tearoff=False)
+        if self.headless:
+            mb.menu = HeadlessWidget(mb, tearoff=False)
+        else:
+            mb.menu = tkinter.Menu(mb, tearoff=False)
         mb["menu"] = mb.menu
         return mb
 
@@ -284,7 +438,7 @@ class Gui(tkinter.Tk):
         try:
             var = options["variable"]
         except KeyError:
-            var = tkinter.IntVar()
+            var = HeadlessVariable(0) if self.headless else tkinter.IntVar()
             override(options, variable=var)
 
         w = self.widget(tkinter.Checkbutton, **options)
@@ -360,6 +514,10 @@ class Gui(tkinter.Tk):
         # or grid
         widopt, packopt, gridopt = split_options(options)
 
+        # without Tk, make a stand-in instead
+        if self.headless:
+            constructor = headless_constructor(constructor)
+
         # Makes the widget and either pack or grid it
         widget = constructor(self.frame, **widopt)
         if hasattr(self.frame, "gridding"):
@@ -641,12 +799,16 @@ class GuiCanvas(tkinter.Canvas):
     """
 
     def __init__(self, w, scale=[1, 1], transforms=None, **options):
-        tkinter.Canvas.__init__(self, w, **options)
+        self.init_canvas(w, **options)
         if transforms != None:
             self.transforms = transforms
         else:
             self.transforms = [CanvasTransform(self, scale)]
 
+    def init_canvas(self, w, **options):
+        """Makes the underlying Tk canvas."""
+        tkinter.Canvas.__init__(self, w, **options)
+
     def get_width(self):
         """Gets the nominal width of this canvas."""
         x = int(self.cget("width"))
@@ -880,6 +1042,10 @@ class GuiCanvas(tkinter.Canvas):
         tag = self.create_text(self.trans([coord]), options, window=widget)
         return Item(self, tag)
 
+    def photo_image(self, **options):
+        """Makes a PhotoImage that can be drawn on this canvas."""
+        return tkinter.PhotoImage(master=self, **options)
+
     def dump(self, filename="canvas.eps"):
         """Create a PostScipt file and dumps the contents of the canvas."""
         bbox = tkinter.Canvas.bbox(self, ALL)
@@ -998,6 +1164,450 @@ class Item(object):
         self.canvas.scale(self.tag, xscale, yscale, xoffset, yoffset)
 
 
+class HeadlessWidget(object):
+    """Stands in for a Tk widget when a Gui runs without Tk.
+
+    Keeps the options it was made with and ignores packing, gridding
+    and bindings.  A headless button can be pressed by calling invoke.
+    """
+
+    def __init__(self, master=None, **options):
+        self.master = master
+        self.options = options
+        self.commands = []
+
+    def configure(self, cnf=None, **options):
+        """Changes the options of this widget."""
+        if cnf:
+            options.update(cnf)
+        self.options.update(options)
+
+    config = configure
+
+    def cget(self, option):
+        """Looks up the value of an option."""
+        return self.options.get(option, "")
+
+    def __getitem__(self, option):
+        return self.cget(option)
+
+    def __setitem__(self, option, value):
+        self.options[option] = value
+
+    def invoke(self):
+        """Calls the command of this widget, if it has one."""
+        command = self.options.get("command")
+        if command:
+            return command()
+
+    def add_command(self, **options):
+        """Adds a command to this (menu) widget."""
+        self.commands.append(options)
+
+    def noop(self, *args, **options):
+        """Does nothing."""
+
+    pack = grid = columnconfigure = rowconfigure = noop
+    bind = unbind = set = yview = xview = deselect = select = destroy = noop
+
+
+class HeadlessVariable(object):
+    """Stands in for a Tk variable."""
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class HeadlessEntry(HeadlessWidget):
+    """Stands in for a Tk Entry: a single line of text."""
+
+    def __init__(self, master=None, **options):
+        HeadlessWidget.__init__(self, master, **options)
+        self.options.setdefault("width", 20)
+        self.text = ""
+
+    def index(self, index):
+        """Converts an index, which can be END, to an int."""
+        if index == END:
+            return len(self.text)
+        return int(index)
+
+    def insert(self, index, text):
+        i = self.index(index)
+        self.text = self.text[:i] + str(text) + self.text[i:]
+
+    def delete(self, first, last=None):
+        i = self.index(first)
+        j = i + 1 if last is None else self.index(last)
+        self.text = self.text[:i] + self.text[j:]
+
+    def get(self):
+        return self.text
+
+
+class HeadlessText(HeadlessWidget):
+    """Stands in for a Tk Text widget.
+
+    Only supports adding text at the beginning or end, and getting
+    or deleting all of it.
+    """
+
+    def __init__(self, master=None, **options):
+        HeadlessWidget.__init__(self, master, **options)
+        self.text = ""
+
+    def insert(self, index, text):
+        if str(index) in ["1.0", "0.0"]:
+            self.text = text + self.text
+        else:
+            self.text += text
+
+    def get(self, *args):
+        # like Tk, the text always ends with a newline
+        return self.text + "\n"
+
+    def delete(self, *args):
+        self.text = ""
+
+
+class SceneItem(object):
+    """An item in a HeadlessCanvas.
+
+    Attributes:
+        id: int item id
+        kind: item type, like "line" or "polygon"
+        coords: flat list of pixel coordinates
+        options: dictionary of item options
+        tags: list of tags
+    """
+
+    def __init__(self, id, kind, coords, options):
+        self.id = id
+        self.kind = kind
+        self.coords = coords
+        tags = options.pop("tags", ())
+        if isinstance(tags, str):
+            tags = tags.split()
+        self.tags = list(tags)
+        self.options = options
+
+    def __repr__(self):
+        return "SceneItem(%d, %r, %r)" % (self.id, self.kind, self.coords)
+
+
+def flatten_coords(args):
+    """Flattens nested lists and tuples of coordinates into a list."""
+    res = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            res.extend(flatten_coords(arg))
+        else:
+            res.append(float(arg))
+    return res
+
+
+def interleave(xs, ys):
+    """Returns a flat list that alternates elements of xs and ys."""
+    res = []
+    for x, y in zip(xs, ys):
+        res.extend([x, y])
+    return res
+
+
+class HeadlessImage(object):
+    """Stands in for a PhotoImage.
+
+    Only keeps track of the size and the number of puts since it
+    was last blanked.
+    """
+
+    def __init__(self, width=0, height=0, **options):
+        self.width = width
+        self.height = height
+        self.puts = 0
+
+    def put(self, data, to=None):
+        self.puts += 1
+
+    def blank(self):
+        self.puts = 0
+
+    def zoom(self, x, y=""):
+        """Returns a new image, x times wider and y times taller."""
+        return HeadlessImage(self.width * x, self.height * (y or x))
+
+
+class HeadlessCanvas(HeadlessWidget, GuiCanvas):
+    """A GuiCanvas that records items in memory instead of drawing them.
+
+    The scene is an ordered dictionary from item ids to SceneItems,
+    in stacking order (the last item is on top).  Coordinates are
+    stored in pixels, after the transforms, just as Tk would.
+    """
+
+    __init__ = GuiCanvas.__init__
+
+    def init_canvas(self, w, **options):
+        """Makes the empty scene instead of a Tk canvas."""
+        HeadlessWidget.__init__(self, w, **options)
+        self.options.setdefault("width", 100)
+        self.options.setdefault("height", 100)
+        self.items = {}
+        self.next_id = 0
+        self.bindings = {}
+
+    def create(self, kind, args, options):
+        """Adds an item to the scene and returns its id."""
+        args = list(args)
+        cnf = {}
+        if args and isinstance(args[-1], dict):
+            cnf = args.pop()
+        cnf = dict(cnf)
+        cnf.update(options)
+
+        self.next_id += 1
+        self.items[self.next_id] = SceneItem(
+            self.next_id, kind, flatten_coords(args), cnf
+        )
+        return self.next_id
+
+    def create_arc(self, *args, **options):
+        return self.create("arc", args, options)
+
+    def create_bitmap(self, *args, **options):
+        return self.create("bitmap", args, options)
+
+    def create_image(self, *args, **options):
+        return self.create("image", args, options)
+
+    def create_line(self, *args, **options):
+        return self.create("line", args, options)
+
+    def create_oval(self, *args, **options):
+        return self.create("oval", args, options)
+
+    def create_polygon(self, *args, **options):
+        return self.create("polygon", args, options)
+
+    def create_rectangle(self, *args, **options):
+        return self.create("rectangle", args, options)
+
+    def create_text(self, *args, **options):
+        return self.create("text", args, options)
+
+    def create_window(self, *args, **options):
+        return self.create("window", args, options)
+
+    def find_withtag(self, tag):
+        """Returns a list of ids of the items with the given tag or id."""
+        if tag == ALL:
+            return list(self.items)
+        if isinstance(tag, int) or (isinstance(tag, str) and tag.isdigit()):
+            id = int(tag)
+            return [id] if id in self.items else []
+        return [id for id, item in self.items.items() if tag in item.tags]
+
+    def find_all(self):
+        return list(self.items)
+
+    def get_items(self, tag):
+        """Returns a list of the SceneItems with the given tag or id."""
+        return [self.items[id] for id in self.find_withtag(tag)]
+
+    def delete(self, *tags):
+        for tag in tags:
+            for id in self.find_withtag(tag):
+                del self.items[id]
+
+    def itemconfigure(self, tag, cnf=None, **options):
+        if cnf:
+            options.update(cnf)
+        for item in self.get_items(tag):
+            item.options.update(options)
+
+    itemconfig = itemconfigure
+
+    def itemcget(self, tag, option):
+        items = self.get_items(tag)
+        if not items:
+            return ""
+        if option == "tags":
+            return " ".join(items[0].tags)
+        return items[0].options.get(option, "")
+
+    def coords(self, tag, *args):
+        """Gets or sets the pixel coordinates of an item."""
+        items = self.get_items(tag)
+        if args:
+            for item in items:
+                item.coords = flatten_coords(args)
+        elif items:
+            return list(items[0].coords)
+        else:
+            return []
+
+    def type(self, tag):
+        items = self.get_items(tag)
+        if items:
+            return items[0].kind
+
+    def pixel_bbox(self, tag):
+        """Returns (x1, y1, x2, y2) in pixels, or None if there are no items."""
+        coords = []
+        for item in self.get_items(tag):
+            coords.extend(pair(item.coords))
+        if not coords:
+            return None
+        xs = [x for x, y in coords]
+        ys = [y for x, y in coords]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def bbox(self, item):
+        """Computes the bounding box of the given item in canvas coordinates.
+
+        Only coordinates are considered, not line widths or text size.
+        """
+        if isinstance(item, list):
+            item = item[0]
+        bbox = self.pixel_bbox(item)
+        if bbox == None:
+            return bbox
+        return BBox(self.invert(pair(bbox)))
+
+    def scroll_config(self, tag=ALL):
+        self.options["scrollregion"] = self.pixel_bbox(tag)
+
+    def canvas_itemcoords(self, item, coords=None):
+        if coords != None:
+            self.coords(item, flatten(self.trans(coords)))
+        else:
+            return self.invert(pair(self.coords(item)))
+
+    def move(self, item, dx, dy, transform=False):
+        if transform:
+            p1, p2 = self.trans([[0, 0], [dx, dy]])
+            dx = p2.x - p1.x
+            dy = p2.y - p1.y
+        for thing in self.get_items(item):
+            thing.coords = [
+                c + (dy if i % 2 else dx) for i, c in enumerate(thing.coords)
+            ]
+
+    def scale(self, tag, xscale, yscale, xoffset, yoffset):
+        for item in self.get_items(tag):
+            xs = item.coords[::2]
+            ys = item.coords[1::2]
+            xs = [xoffset + (x - xoffset) * xscale for x in xs]
+            ys = [yoffset + (y - yoffset) * yscale for y in ys]
+            item.coords = interleave(xs, ys)
+
+    def restack(self, tag, top):
+        """Moves the items with the given tag to the top or bottom."""
+        ids = self.find_withtag(tag)
+        moved = [(id, self.items.pop(id)) for id in ids]
+        if top:
+            self.items.update(moved)
+        else:
+            rest = list(self.items.items())
+            self.items = dict(moved + rest)
+
+    def lift(self, tag, *args):
+        self.restack(tag, True)
+
+    def lower(self, tag, *args):
+        self.restack(tag, False)
+
+    tag_raise = lift
+    tag_lower = lower
+
+    def tag_bind(self, tag, event=None, func=None, add=None):
+        self.bindings[tag, event] = func
+
+    def tag_unbind(self, tag, event=None, *args):
+        self.bindings.pop((tag, event), None)
+
+    def winfo_rgb(self, color):
+        """Looks up a color name or #rrggbb string; returns 16-bit r, g, b."""
+        return tuple(x * 257 for x in get_rgb(color))
+
+    def photo_image(self, **options):
+        return HeadlessImage(**options)
+
+    def dump(self, filename="canvas.eps"):
+        """Writes the scene as an SVG file, since there is no PostScript
+        without Tk.
+
+        The extension of filename is replaced with .svg.  Lines,
+        polygons and rectangles are drawn as outlines in their fill
+        (or outline) color; other kinds of items are left out.
+
+        Returns:
+            name of the file
+        """
+        # Figure imports World, which imports this module
+        from .Figure import SvgCanvas
+
+        filename = os.path.splitext(filename)[0] + ".svg"
+        width = int(self.options["width"])
+        height = int(self.options["height"])
+        svg = SvgCanvas(filename, width, height, self.options.get("bg", "white"))
+
+        for item in self.items.values():
+            points = [tuple(point) for point in pair(item.coords)]
+            options = item.options
+            if item.kind == "line":
+                color = options.get("fill", "black")
+            elif item.kind == "polygon":
+                color = options.get("outline") or options.get("fill", "black")
+                points.append(points[0])
+            elif item.kind == "rectangle":
+                color = options.get("outline") or options.get("fill") or "black"
+                (x1, y1), (x2, y2) = points
+                points = [(x1, y1), (x2, y1), (x2, y2), (x1, y2), (x1, y1)]
+            else:
+                continue
+            if color and len(points) > 1:
+                svg.draw_polyline(points, color, float(options.get("width", 1)))
+
+        svg.finish()
+        return filename
+
+
+# which stand-in to use for each widget when a Gui is headless;
+# anything else gets a HeadlessWidget
+HEADLESS_WIDGETS = {
+    GuiCanvas: HeadlessCanvas,
+    tkinter.Entry: HeadlessEntry,
+    tkinter.Text: HeadlessText,
+}
+
+
+def headless_constructor(constructor):
+    """Finds the stand-in for a widget constructor when a Gui is headless.
+
+    Subclasses of GuiCanvas get a headless version of the subclass,
+    which is made the first time it is needed.
+    """
+    try:
+        return HEADLESS_WIDGETS[constructor]
+    except KeyError:
+        pass
+
+    if not (isinstance(constructor, type) and issubclass(constructor, GuiCanvas)):
+        return HeadlessWidget
+
+    name = "Headless" + constructor.__name__
+    cls = type(name, (HeadlessCanvas, constructor), dict(__init__=constructor.__init__))
+    HEADLESS_WIDGETS[constructor] = cls
+    return cls
+
+
 class Transform(object):
     """Provides methods for transforming lists of coordinates.
 
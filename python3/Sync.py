@@ -7,9 +7,16 @@ Copyright 2011 Allen B. Downey
 Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
 """
 
+import collections
+import contextvars
 import optparse
 import os
 import copy
+import hashlib
+import heapq
+import importlib.util
+import json
+import marshal
 import random
 import sys
 import string
@@ -17,16 +24,31 @@ import time
 
 # the following definitions can be accessed in the simulator
 
-current_thread = None
+# the simulated thread that is running a line of code; each OS thread
+# has its own, so simulations in different threads don't interfere
+running_thread = contextvars.ContextVar("running_thread", default=None)
+
+
+def get_current_thread():
+    """Gets the simulated thread that is running a line of code."""
+    return running_thread.get()
 
 
 def noop(*args):
     """A handy function taht does nothing."""
 
 
+def mark_changed(obj):
+    """Records that a line of code modified obj in place, so the
+    views of the variables that refer to it get updated."""
+    thread = get_current_thread()
+    if thread is not None:
+        thread.sync.locals.mutated.add(id(obj))
+
+
 def balk():
     """Jumps to the top of the column."""
-    current_thread.balk()
+    get_current_thread().balk()
 
 
 class Semaphore:
@@ -35,6 +57,9 @@ class Semaphore:
     Maintains a random queue.
     """
 
+    # whether the order of the queue matters
+    ordered = False
+
     def __init__(self, n=0):
         self.n = n
         self.queue = []
@@ -43,17 +68,19 @@ class Semaphore:
         return str(self.n)
 
     def wait(self):
+        mark_changed(self)
         self.n -= 1
         if self.n < 0:
             self.block()
         return self.n
 
     def block(self):
-        thread = current_thread
+        thread = get_current_thread()
         thread.enqueue()
         self.queue.append(thread)
 
     def signal(self, n=1):
+        mark_changed(self)
         for i in range(n):
             self.n += 1
             if self.queue:
@@ -61,22 +88,74 @@ class Semaphore:
 
     def unblock(self):
         """Chooses a random thread and unblocks it."""
-        thread = random.choice(self.queue)
-        self.queue.remove(thread)
+        # the order doesn't matter, so move the last thread into
+        # the gap rather than shifting the rest down
+        queue = self.queue
+        i = choose_index(len(queue))
+        thread = queue[i]
+        queue[i] = queue[-1]
+        queue.pop()
         thread.dequeue()
         thread.next_loop()
 
+    def waiting(self):
+        """Returns a list of the waiting threads."""
+        return list(self.queue)
+
 
 class FifoSemaphore(Semaphore):
     """Semaphore that implements a FIFO queue."""
 
+    ordered = True
+
+    def __init__(self, n=0):
+        Semaphore.__init__(self, n)
+        self.queue = collections.deque()
+
     def unblock(self):
         """Chooses the first thread and unblocks it."""
-        thread = self.queue.pop(0)
+        thread = self.queue.popleft()
         thread.dequeue()
         thread.next_loop()
 
 
+# with a FIFO queue, a waiting thread can't be passed over forever
+StrongSemaphore = FifoSemaphore
+
+
+class PrioritySemaphore(Semaphore):
+    """Semaphore that wakes the thread with the lowest priority first.
+
+    Threads with the same priority are woken in the order they arrived.
+    """
+
+    ordered = True
+
+    def __init__(self, n=0):
+        Semaphore.__init__(self, n)
+        self.count = 0
+
+    def wait(self, priority=0):
+        mark_changed(self)
+        self.n -= 1
+        if self.n < 0:
+            thread = get_current_thread()
+            thread.enqueue()
+            self.count += 1
+            heapq.heappush(self.queue, (priority, self.count, thread))
+        return self.n
+
+    def unblock(self):
+        """Chooses the thread with the lowest priority and unblocks it."""
+        priority, count, thread = heapq.heappop(self.queue)
+        thread.dequeue()
+        thread.next_loop()
+
+    def waiting(self):
+        """Returns a list of the waiting threads, in the order they will wake."""
+        return [thread for priority, count, thread in sorted(self.queue)]
+
+
 class Lightswitch:
     """Encapsulates the lightswitch pattern."""
 
@@ -85,6 +164,7 @@ class Lightswitch:
         self.mutex = Semaphore(1)
 
     def lock(self, semaphore):
+        mark_changed(self)
         self.mutex.wait()
         self.counter += 1
         if self.counter == 1:
@@ -92,6 +172,7 @@ class Lightswitch:
         self.mutex.signal()
 
     def unlock(self, semaphore):
+        mark_changed(self)
         self.mutex.wait()
         self.counter -= 1
         if self.counter == 0:
@@ -99,24 +180,211 @@ class Lightswitch:
         self.mutex.signal()
 
 
+def choose(seq):
+    """Chooses an element of a sequence, at random unless the
+    simulator is exploring the choices."""
+    return get_current_thread().sync.choose(seq)
+
+
+def choose_index(n):
+    """Chooses an index from range(n), like choose."""
+    return get_current_thread().sync.choose_index(n)
+
+
 def pid():
     """Gets the ID of the current thread."""
-    return current_thread.name
+    return get_current_thread().name
 
 
 def num_threads():
     """Gets the number of threads."""
-    sync = current_thread.column.p
+    sync = get_current_thread().column.p
     return len(sync.threads)
 
 
 # make globals and locals for the simulator
 
 sim_globals = copy.copy(globals())
-sim_locals = dict()
 
 # anything defined after this point is not available inside the simulator
 
+
+class Locals(dict):
+    """The variables of the simulated program.
+
+    Keeps track of assignments, so the simulator can tell which
+    variables a line of code changed without comparing all of them.
+    Objects that change in place, like Semaphores, report themselves
+    with mark_changed.  Other mutable values, like lists, could be
+    changed by any line, so their names count as written every step.
+
+    Attributes:
+        defined: set of names that were assigned for the first time
+        changed: set of names that were assigned a different object
+        mutated: set of ids of objects that were modified in place
+        names: map from the id of each value to the set of its names
+        unwatched: set of names whose values might change in place
+                   without reporting it
+    """
+
+    def __init__(self, *args, **kwds):
+        dict.__init__(self, *args, **kwds)
+        self.defined = set()
+        self.changed = set()
+        self.mutated = set()
+        self.names = {}
+        self.unwatched = set()
+        for key, value in self.items():
+            self.add_name(key, value)
+
+    def __reduce__(self):
+        # copies (including the Explorer's snapshots) rebuild the
+        # map of names, since the ids of the values change
+        return Locals, (dict(self),)
+
+    def __setitem__(self, key, value):
+        old = self.get(key, Locals)
+        if old is Locals:
+            self.defined.add(key)
+        elif old is not value:
+            self.changed.add(key)
+            self.remove_name(key, old)
+        dict.__setitem__(self, key, value)
+        self.add_name(key, value)
+
+    def __delitem__(self, key):
+        self.remove_name(key, self[key])
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        dict.clear(self)
+        self.names = {}
+        self.unwatched = set()
+
+    def add_name(self, key, value):
+        """Records that key refers to value."""
+        self.names.setdefault(id(value), set()).add(key)
+        if isinstance(value, WATCHED_TYPES):
+            self.unwatched.discard(key)
+        else:
+            self.unwatched.add(key)
+
+    def remove_name(self, key, value):
+        """Records that key no longer refers to value."""
+        names = self.names.get(id(value))
+        if names is not None:
+            names.discard(key)
+            if not names:
+                del self.names[id(value)]
+        self.unwatched.discard(key)
+
+    def clear_writes(self):
+        """Forgets the assignments so far."""
+        self.defined = set()
+        self.changed = set()
+        self.mutated = set()
+
+    def writes(self):
+        """Returns the set of names that were assigned, that refer to
+        an object that was modified in place, or that might have been."""
+        written = self.defined | self.changed | self.unwatched
+        for obj_id in self.mutated:
+            written.update(self.names.get(obj_id, ()))
+        return written
+
+
+# values of these types can't change in place, or report it when they
+# do; Locals assumes that anything else might change at any time
+WATCHED_TYPES = (
+    int,
+    float,
+    complex,
+    str,
+    bytes,
+    tuple,
+    frozenset,
+    range,
+    type(None),
+    Semaphore,
+    Lightswitch,
+)
+
+
+class Scheduler(object):
+    """The parts of Sync and Explorer that run, record and replay steps.
+
+    Threads call begin_step at the start of each step, and Semaphores
+    call choose (through the simulator's choose) when they pick a
+    thread to wake up.
+
+    Attributes:
+        script: list of choices to make during the next step, by index
+        made: list of choices made during the current step
+        ranges: list of the number of options for each choice
+        rng: source of random choices past the end of the script,
+             or None to take the first option
+        trace: TraceWriter that records the steps, or None
+        current_thread: the Thread that ran the last line of code
+    """
+
+    script = ()
+    rng = None
+    trace = None
+    current_thread = None
+
+    def begin_step(self):
+        """Forgets the choices made during the previous step."""
+        self.made = []
+        self.ranges = []
+
+    def choose_index(self, n):
+        """Chooses the index from range(n) the script calls for.
+
+        Past the end of the script, the choice is random, or 0 if
+        there is no rng.  Records the choice and the number of options
+        so that next_script can work out the next combination to try.
+        """
+        k = len(self.made)
+        if k < len(self.script):
+            i = self.script[k]
+        elif self.rng is not None:
+            i = self.rng.randrange(n)
+        else:
+            i = 0
+        self.made.append(i)
+        self.ranges.append(n)
+        return i
+
+    def choose(self, seq):
+        """Chooses an element of seq (see choose_index)."""
+        return seq[self.choose_index(len(seq))]
+
+    def find_thread(self, name):
+        for thread in self.threads:
+            if thread.name == name:
+                return thread
+        raise ValueError("No thread named %s" % name)
+
+    def replay_event(self, event):
+        """Runs an event from a trace file (see TraceWriter).
+
+        Returns:
+            the Thread that ran or was made
+        """
+        if "create" in event:
+            thread = self.cols[event["create"]].create_thread()
+            if thread.name != event["thread"]:
+                raise ValueError("The trace does not match the threads.")
+            return thread
+
+        thread = self.find_thread(event["step"])
+        self.script = event.get("choices", [])
+        try:
+            thread.step_loop()
+        finally:
+            self.script = ()
+        return thread
+
 from tkinter import N, S, E, W, TOP, BOTTOM, LEFT, RIGHT, END
 from .Gui import Gui, GuiCanvas
 
@@ -136,46 +404,40 @@ FSU = 9  # FSU, the fundamental Sync unit,
 # determines the size of most things.
 
 
-class Sync(Gui):
+class Sync(Gui, Scheduler):
     """Represents the thread simulator."""
 
-    def __init__(self, args=[""]):
-        Gui.__init__(self)
+    def __init__(self, args=[""], backend=None):
+        Gui.__init__(self, backend=backend)
         self.parse_args(args)
         self.namer = Namer()
 
-        self.locals = sim_locals
-        self.globals = sim_globals
+        # each Sync has its own variables
+        self.locals = Locals()
+        self.globals = copy.copy(sim_globals)
 
         self.views = {}
         self.w = self
         self.threads = []
         self.running = False
+        self.verbose = self.options.verbose
+        self.dirty = set()
+        self.rng = random
+        self.position = None
         self.delay = 0.2
         self.setup()
         self.run_init()
         for col in self.cols:
             col.create_thread()
 
-    def parse_args(self, args):
-        parser = optparse.OptionParser()
-        parser.add_option(
-            "-w",
-            "--write",
-            dest="write",
-            action="store_true",
-            default=False,
-            help="Write thread code in code subdirectory?",
-        )
-        parser.add_option(
-            "-s",
-            "--side",
-            dest="initside",
-            action="store_true",
-            default=False,
-            help="Move the initialization code to the left side?",
-        )
+        if self.options.record:
+            self.record(self.options.record)
+        if self.options.replay:
+            self.load_trace(self.options.replay)
+            self.replay_buttons()
 
+    def parse_args(self, args):
+        parser = make_parser()
         (self.options, args) = parser.parse_args(args)
 
         if args:
@@ -198,6 +460,7 @@ class Sync(Gui):
     def destroy(self):
         """Closes the top window."""
         self.running = False
+        self.stop_recording()
         Gui.destroy(self)
 
     def setup(self):
@@ -226,6 +489,15 @@ class Sync(Gui):
         self.bu(text="Random Step", command=self.random_step)
         self.endfr()
 
+    def replay_buttons(self):
+        """Makes the buttons that control a replay."""
+        self.row([1, 1, 1, 1])
+        self.bu(text="Play", command=self.play)
+        self.bu(text="Stop", command=self.stop)
+        self.bu(text="Back", command=self.step_back)
+        self.bu(text="Forward", command=self.replay_next)
+        self.endfr()
+
     def register(self, thread):
         """Adds a new thread."""
         self.threads.append(thread)
@@ -271,56 +543,29 @@ class Sync(Gui):
     def read_file(self, filename):
         """Read a file that contains code for the simulator to execute.
 
-        Lines that start with ## do not appear
-        in the display.
-
-        A line that starts with "## thread" indicates the beginning of
-        a new column of code.
-
-        Returns a list of blocks where each block is a list of lines.
+        See load_program and read_blocks.
         """
-
-        def is_new_thread(line):
-            if line[0:2] != "##":
-                return False
-
-            words = line.strip("#").split()
-            word = words[0].lower()
-            return word == "thread"
-
-        self.blocks = []
-        block = []
-        self.blocks.append(block)
-
-        fp = open(filename)
-        for line in fp:
-            line = line.rstrip()
-
-            if is_new_thread(line):
-                block = []
-                self.blocks.append(block)
-            else:
-                block.append(line)
-
-        fp.close()
+        self.program = load_program(filename)
+        self.blocks = [list(block.text) for block in self.program.blocks]
 
     def make_columns(self):
-        """Adds the code in self.blocks to the GUI."""
+        """Adds the code in self.program to the GUI."""
         if not self.blocks:
             return
 
         side = LEFT if self.options.initside else TOP
         self.topcol = TopColumn(self, side=side)
 
-        self.topcol.add_rows(self.blocks[0])
+        blocks = self.program.blocks
+        self.topcol.add_block(blocks[0])
 
         self.colfr = self.fr()
         self.cols = []
         self.endfr()
 
-        for block in self.blocks[1:]:
+        for block in blocks[1:]:
             col = self.add_col(0)
-            col.add_rows(block)
+            col.add_block(block)
 
         self.buttons()
 
@@ -364,7 +609,8 @@ class Sync(Gui):
         if not self.topcol.num_rows():
             return
 
-        print("running init")
+        if self.verbose:
+            print("running init")
         self.clear_views()
         self.views = {}
 
@@ -376,49 +622,431 @@ class Sync(Gui):
 
         self.unregister(thread)
 
-    def update_views(self):
-        """Loops through the views and updates them."""
-        for key, view in self.views.items():
-            view.update(self.locals[key])
+    def restart(self, columns=None):
+        """Starts over with new threads and runs the initialization code.
+
+        Args:
+            columns: list with the index of the column for each new
+                     thread; by default, the columns of the current threads
+        """
+        if columns is None:
+            columns = [self.cols.index(thread.column) for thread in self.threads]
+
+        for thread in list(self.threads):
+            thread.remove()
+        self.locals.clear()
+        self.namer = Namer()
+        self.run_init()
+
+        for i in columns:
+            self.cols[i].create_thread()
+
+    def record(self, filename):
+        """Starts over and records the steps in a trace file."""
+        self.stop_recording()
+        self.restart()
+        self.trace = TraceWriter(filename, self)
+
+    def stop_recording(self):
+        """Finishes the trace file, if there is one."""
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+    def load_trace(self, filename):
+        """Reads a trace file and goes to the beginning of it."""
+        self.stop_recording()
+        self.header, self.events = read_trace(filename)
+        self.position = None
+        self.seek(0)
+
+    def seek(self, n):
+        """Goes to the point in the loaded trace after n events.
+
+        Going forward replays the events from the current position;
+        going back starts over.
+        """
+        if self.position is None or n < self.position:
+            threads = self.header["threads"]
+            self.restart([col for name, col in threads])
+            if [thread.name for thread in self.threads] != [name for name, col in threads]:
+                raise ValueError("The trace does not match the threads.")
+            self.position = 0
+
+        n = min(n, len(self.events))
+        while self.position < n:
+            self.replay_next()
+
+    def replay_next(self):
+        """Runs the next event in the loaded trace."""
+        if self.position >= len(self.events):
+            self.running = False
+            return
+        self.replay_event(self.events[self.position])
+        self.position += 1
+
+    def step_back(self):
+        """Goes back one event in the loaded trace."""
+        if self.position:
+            self.seek(self.position - 1)
+
+    def play(self, delay=None):
+        """Replays the rest of the loaded trace.
+
+        Args:
+            delay: seconds between events (default self.delay)
+        """
+        if delay is not None:
+            self.delay = delay
+        self.run_helper(self.replay_next)
+
+    def update_views(self, keys=None):
+        """Updates the views of the given variables (default all)."""
+        if keys is None:
+            keys = self.views
+        for key in keys:
+            view = self.views.get(key)
+            if view is not None:
+                view.update(self.locals[key])
 
     def clear_views(self):
         """Loops through the views and clears them."""
         for key, view in self.views.items():
             view.clear()
 
+    def redraw_later(self, queue):
+        """Arranges for a QueueCanvas to be redrawn.
+
+        Queues change several times during a step, so they are
+        redrawn once, when the GUI is next idle.
+        """
+        if not self.dirty:
+            self.after_idle(self.redraw_queues)
+        self.dirty.add(queue)
+
+    def redraw_queues(self):
+        """Redraws the queues that have changed."""
+        dirty = self.dirty
+        self.dirty = set()
+        for queue in dirty:
+            queue.draw_queue()
+
     def qu(self, **options):
         """Makes a queue."""
         return self.widget(QueueCanvas, **options)
 
 
-def subtract(d1, d2):
-    """Subtracts two dictionaries.
+def make_parser():
+    """Makes the parser for the command-line options."""
+    parser = optparse.OptionParser()
+    parser.add_option(
+        "-w",
+        "--write",
+        dest="write",
+        action="store_true",
+        default=False,
+        help="Write thread code in code subdirectory?",
+    )
+    parser.add_option(
+        "-s",
+        "--side",
+        dest="initside",
+        action="store_true",
+        default=False,
+        help="Move the initialization code to the left side?",
+    )
+    parser.add_option(
+        "-c",
+        "--check",
+        dest="check",
+        action="store_true",
+        default=False,
+        help="Check every interleaving instead of starting the GUI?",
+    )
+    parser.add_option(
+        "-t",
+        "--threads",
+        dest="threads",
+        default="1",
+        help="Threads per column when checking, like 3 or 2,1",
+    )
+    parser.add_option(
+        "-l",
+        "--limit",
+        dest="limit",
+        type="int",
+        default=1,
+        help="Threads allowed in a critical section when checking",
+    )
+    parser.add_option(
+        "-f",
+        "--fuzz",
+        dest="fuzz",
+        type="int",
+        default=0,
+        help="Run this many random schedules instead of starting the GUI",
+    )
+    parser.add_option(
+        "--steps",
+        dest="steps",
+        type="int",
+        default=1000,
+        help="Steps in each random schedule",
+    )
+    parser.add_option(
+        "--seed",
+        dest="seed",
+        type="int",
+        default=0,
+        help="Seed of the first random schedule",
+    )
+    parser.add_option(
+        "-j",
+        "--processes",
+        dest="processes",
+        type="int",
+        default=None,
+        help="Number of processes for random schedules (default one per CPU)",
+    )
+    parser.add_option(
+        "-r",
+        "--record",
+        dest="record",
+        default="",
+        help="Record the steps in this trace file",
+    )
+    parser.add_option(
+        "--replay",
+        dest="replay",
+        default="",
+        help="Replay the steps in this trace file",
+    )
+    parser.add_option(
+        "-v",
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        default=False,
+        help="Print each line as it runs?",
+    )
+    return parser
+
+
+def read_blocks(filename):
+    """Read a file that contains code for the simulator to execute.
+
+    Lines that start with ## do not appear
+    in the display.
+
+    A line that starts with "## thread" indicates the beginning of
+    a new column of code.
+
+    Returns a list of blocks where each block is a list of lines.
+    """
+    fp = open(filename)
+    blocks = split_blocks(fp)
+    fp.close()
+    return blocks
+
+
+def split_blocks(lines):
+    """Splits lines of code into blocks (see read_blocks)."""
+
+    def is_new_thread(line):
+        if line[0:2] != "##":
+            return False
+
+        words = line.strip("#").split()
+        word = words[0].lower()
+        return word == "thread"
+
+    blocks = []
+    block = []
+    blocks.append(block)
+
+    for line in lines:
+        line = line.rstrip()
+
+        if is_new_thread(line):
+            block = []
+            blocks.append(block)
+        else:
+            block.append(line)
+
+    return blocks
+
+
+class CodeBlock(object):
+    """The code for one column, parsed and compiled.
+
+    A CodeBlock is shared by everything that loads the same program,
+    so it should not be modified.
 
-    Returns a new dictionary containing all the keys from
-    d1 that are not in d2.
+    Attributes:
+        text: tuple of the lines in the file
+        lines: tuple of the lines that are not blank, one for each row
+        indents: tuple of the indents of the lines
+        ends: tuple of where the block each line starts ends (see find_ends)
+        codes: tuple with the marshaled (keyword, code) of each line,
+               or None for lines that don't compile
     """
-    d = {}
-    for key in d1:
-        if key not in d2:
-            d[key] = d1[key]
-    return d
 
+    def __init__(self, text, indents=None, ends=None, codes=None):
+        """Makes a CodeBlock, compiling the lines unless codes is provided.
 
-def diff_dict(d1, d2):
-    """Diffs two dictionaries.
+        Args:
+            text: lines of code
+            indents, ends, codes: from the cache file, to skip the work
+        """
+        self.text = tuple(text)
+        self.lines = tuple(line for line in self.text if line)
+        if indents is None:
+            indents = [count_spaces(line) for line in self.lines]
+        self.indents = tuple(indents)
+        if ends is None:
+            ends = find_ends(self.indents)
+        self.ends = tuple(ends)
+
+        # the Lines made so far, in case they are needed again
+        self.made = [None] * len(self.lines)
+        if codes is None:
+            self.made = [compile_line(line) for line in self.lines]
+            codes = [line and marshal.dumps((line.keyword, line.code)) for line in self.made]
+        self.codes = tuple(codes)
+
+    def get_line(self, i):
+        """Returns the Line for line i.
+
+        Lines from the cache are unmarshaled the first time they are
+        needed.  Lines that don't compile raise their SyntaxError.
+        """
+        line = self.made[i]
+        if line is None:
+            source = self.lines[i]
+            code = self.codes[i]
+            if code is None:
+                line = Line(source)
+            else:
+                line = Line(source, marshal.loads(code))
+            self.made[i] = line
+        return line
+
+
+def compile_line(source):
+    """Returns a Line, or None if the source doesn't compile."""
+    try:
+        return Line(source)
+    except (SyntaxError, ValueError):
+        return None
+
+
+class Program(object):
+    """A file of code for the simulator, parsed and compiled.
+
+    Attributes:
+        filename: name of the file
+        blocks: tuple of CodeBlocks; the first is the initialization code
+    """
+
+    def __init__(self, filename, blocks):
+        self.filename = filename
+        self.blocks = tuple(blocks)
+
+
+# change this when the format of the cache changes
+CACHE_VERSION = 1
+
+
+def cache_filename(filename):
+    """Returns the name of the cache file for a program.
+
+    The cache file goes where the compiled Python file would: in
+    __pycache__, or under sys.pycache_prefix if it is set.  Its name
+    includes the interpreter, because marshal formats differ.
+    """
+    # the extra extension keeps the whole name of the source file,
+    # so mutex.py and mutex.txt don't share a cache file
+    path = importlib.util.cache_from_source(os.path.abspath(filename) + ".sync")
+    return os.path.splitext(path)[0] + ".sync"
+
+
+def load_program(filename, cache=True):
+    """Reads a file of code for the simulator and compiles it.
+
+    The Program is saved in a cache file (see cache_filename) and
+    loaded from there next time, as long as the modification time
+    and hash of the file are the same.  Like the import system, it
+    doesn't write the cache file if sys.dont_write_bytecode is set.
+
+    Args:
+        filename: name of the file
+        cache: whether to use the cache file
+
+    Returns:
+        Program
+    """
+    fp = open(filename, "rb")
+    data = fp.read()
+    fp.close()
+    key = (os.stat(filename).st_mtime_ns, hashlib.sha1(data).hexdigest())
+
+    if cache:
+        program = read_cache(filename, key)
+        if program is not None:
+            return program
+
+    blocks = split_blocks(data.decode().splitlines())
+    program = Program(filename, [CodeBlock(block) for block in blocks])
+
+    if cache and not sys.dont_write_bytecode:
+        write_cache(program, key)
+    return program
 
-    Returns two dictionaries: the first contains all the keys
-    from d1 that are not in d2; the second contains all the keys
-    that are in both dictionaries, but which have different values.
+
+def read_cache(filename, key):
+    """Loads a Program from its cache file.
+
+    Returns:
+        Program, or None if there is no cache file for this key
     """
-    d = {}
-    c = {}
-    for key in d1:
-        if key not in d2:
-            d[key] = d1[key]
-        elif d1[key] is not d2[key]:
-            c[key] = d1[key]
-    return d, c
+    try:
+        fp = open(cache_filename(filename), "rb")
+        try:
+            version, cached_key, data = marshal.load(fp)
+        finally:
+            fp.close()
+    except (OSError, EOFError, ValueError, TypeError, NotImplementedError):
+        return None
+
+    if version != CACHE_VERSION or tuple(cached_key) != key:
+        return None
+    try:
+        return Program(filename, [CodeBlock(*block) for block in data])
+    except (TypeError, ValueError):
+        return None
+
+
+def write_cache(program, key):
+    """Saves a Program in its cache file, if possible."""
+    data = tuple(
+        (block.text, block.indents, block.ends, block.codes) for block in program.blocks
+    )
+    try:
+        path = cache_filename(program.filename)
+    except NotImplementedError:
+        # the interpreter has no cache tag
+        return
+    temp = "%s.%d" % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fp = open(temp, "wb")
+        try:
+            marshal.dump((CACHE_VERSION, key, data), fp)
+        finally:
+            fp.close()
+        os.replace(temp, path)
+    except OSError:
+        pass
 
 
 def trim_block(block):
@@ -459,6 +1087,7 @@ class Row(Widget):
 
     def setup(self, text=""):
         self.tag = None
+        self.line = None
         self.fr = self.w.row([0, 0, 1])
         self.queued = self.w.qu(side=LEFT, n=3)
         self.runnable = self.w.qu(side=LEFT, n=3, label="Run")
@@ -478,6 +1107,7 @@ class Row(Widget):
 
     def keystroke(self, event=None):
         "resize the entry whenever the user types a character"
+        self.forget_line()
         self.entry_size()
 
     def entry_size(self):
@@ -503,11 +1133,30 @@ class Row(Widget):
     def put(self, text):
         self.en.delete(0, END)
         self.en.insert(0, text)
+        self.forget_line()
         self.entry_size()
 
     def get(self):
         return self.en.get()
 
+    def get_line(self):
+        """Returns the code in this row as a compiled Line.
+
+        The Line is kept until the text changes (see keystroke and put).
+        """
+        if self.line is None:
+            self.line = self.p.get_line(self)
+        return self.line
+
+    def forget_line(self):
+        """Discards the compiled Line and the column's RowTable.
+
+        The column stops using its CodeBlock, which no longer matches.
+        """
+        self.line = None
+        self.p.table = None
+        self.p.block = None
+
 
 class TopRow(Row):
     """Rows in the initialization code at the top.
@@ -527,6 +1176,8 @@ class Column(Widget):
     """A list of rows and a few buttons."""
 
     def setup(self, side=TOP, n=0, Row=Row):
+        self.table = None
+        self.block = None
         self.fr = self.w.fr(side=side, bd=3)
         self.Row = Row
         self.rows = [self.Row(self) for i in range(n)]
@@ -545,25 +1196,112 @@ class Column(Widget):
             if line or keep_blanks:
                 self.add_row(line)
 
+    def add_block(self, block):
+        """Adds rows for the lines of a CodeBlock.
+
+        Until the code is edited, the rows get their compiled Lines,
+        and the column its RowTable, from the block.
+        """
+        for line in block.lines:
+            self.add_row(line)
+        self.table = RowTable(self.rows, block.indents, block.ends)
+        self.block = block
+
+    def get_line(self, row):
+        """Returns the compiled Line for a row."""
+        if self.block is None:
+            return Line(row.get())
+        return self.block.get_line(self.get_table().index[row])
+
     def add_row(self, text=""):
         self.w.pushfr(self.fr)
         row = self.Row(self, text)
         self.w.popfr()
         self.rows.append(row)
+        self.table = None
+        self.block = None
 
     def create_thread(self):
         new = Thread(self)
+        if self.p.trace is not None:
+            self.p.trace.write_create(new)
         return new
 
+    def get_table(self):
+        """Returns the RowTable, making a new one if the code changed."""
+        if self.table is None:
+            self.table = RowTable(self.rows)
+        return self.table
+
     def next_row(self, row):
         if row is None:
             return self.rows[0]
 
-        index = self.rows.index(row)
-        try:
-            return self.rows[index + 1]
-        except IndexError:
-            return None
+        return self.get_table().next_row(row)
+
+    def end_of_block(self, row):
+        """Returns the first row after the block row starts, or None."""
+        return self.get_table().end_of_block(row)
+
+    def row_index(self, row):
+        """Returns the position of row in the column."""
+        return self.get_table().index[row]
+
+
+class RowTable(object):
+    """The structure of the code in a column.
+
+    Attributes:
+        rows: list of rows
+        index: map from each row to its position in rows
+        indents: list of the indent of each row
+        ends: list with, for each row, the position of the next row
+              that is not indented more, which is where the block
+              it starts ends; len(rows) if the block runs to the end
+    """
+
+    def __init__(self, rows, indents=None, ends=None):
+        """Makes a table, or uses the indents and ends of a CodeBlock."""
+        self.rows = list(rows)
+        self.index = dict((row, i) for i, row in enumerate(self.rows))
+        if indents is None:
+            indents = [count_spaces(row.get()) for row in self.rows]
+        self.indents = indents
+        if ends is None:
+            ends = find_ends(indents)
+        self.ends = ends
+
+    def get_row(self, i):
+        """Returns the row at position i, or None if i is off the end."""
+        if i < len(self.rows):
+            return self.rows[i]
+        return None
+
+    def next_row(self, row):
+        return self.get_row(self.index[row] + 1)
+
+    def end_of_block(self, row):
+        return self.get_row(self.ends[self.index[row]])
+
+
+def find_ends(indents):
+    """Finds where the block that starts at each line ends.
+
+    Args:
+        indents: list of the indents of a column of lines
+
+    Returns:
+        list with, for each line, the position of the next line that
+        is not indented more, or len(indents) if there isn't one
+    """
+    n = len(indents)
+    ends = [n] * n
+    stack = []
+    for i, indent in enumerate(indents):
+        while stack and indents[stack[-1]] >= indent:
+            ends[stack.pop()] = i
+        stack.append(i)
+    return ends
 
 
 class TopColumn(Column):
@@ -589,35 +1327,57 @@ class QueueCanvas(GuiCanvas):
         height = 3 * FSU
         GuiCanvas.__init__(self, w, width=width, height=height, transforms=[])
         self.threads = []
+        self.drawn = {}
         self.setup()
 
     def setup(self):
         self.text([3, 15], self.label, font=font, anchor=W, fill="white")
 
     def add_thread(self, thread):
-        self.undraw_queue()
         self.threads.append(thread)
-        self.draw_queue()
+        thread.sync.redraw_later(self)
 
     def remove_thread(self, thread):
-        self.undraw_queue()
         self.threads.remove(thread)
-        self.draw_queue()
+        thread.sync.redraw_later(self)
 
-    def draw_queue(self):
+    def positions(self):
+        """Returns the positions of the threads in the queue."""
         x = FSU
         y = FSU
         r = 0.9 * FSU
+        t = []
         for thread in self.threads:
-            self.draw_thread(thread, x, y, r)
+            t.append((x, y))
             x += 1.5 * r
             if x > self.get_width():
                 x = FSU
                 y += 1.5 * r
+        return t
+
+    def draw_queue(self):
+        """Makes the display match the queue.
+
+        Threads that were already drawn are moved, if necessary,
+        rather than drawn again.
+        """
+        drawn = self.drawn
+        self.drawn = {}
+        for thread, (x, y) in zip(self.threads, self.positions()):
+            old = drawn.pop(thread, None)
+            if old is None:
+                self.draw_thread(thread, x, y)
+            elif old != (x, y):
+                self.move(thread.tag, x - old[0], y - old[1])
+            self.drawn[thread] = x, y
+
+        for thread in drawn:
+            self.undraw_thread(thread)
 
     def undraw_queue(self):
-        for thread in self.threads:
-            self.delete(thread.tag)
+        for thread in self.drawn:
+            self.undraw_thread(thread)
+        self.drawn = {}
 
     def draw_thread(self, thread, x=FSU, y=FSU, r=0.9 * FSU):
         thread.tag = "Thread" + thread.name
@@ -672,6 +1432,63 @@ class Namespace:
     """
 
 
+class Line(object):
+    """A line of code, compiled and classified.
+
+    Attributes:
+        source: the text of the line
+        indent: number of leading spaces, after expanding tabs
+        keyword: "if", "while" or "else" for the header of a compound
+                 statement, None for a simple statement
+        code: compiled statement, or compiled condition for if and
+              while, or None for else
+    """
+
+    def __init__(self, source, compiled=None):
+        """Compiles a line of code.
+
+        Args:
+            source: the text of the line
+            compiled: (keyword, code) from another Line with the same
+                      source, to skip compiling
+        """
+        self.source = source
+        self.indent = count_spaces(source)
+        if compiled is not None:
+            self.keyword, self.code = compiled
+            return
+
+        self.keyword = None
+        self.code = None
+
+        s = source.strip()
+        try:
+            self.code = compile(s, "<user-provided code>", "exec")
+            return
+        except SyntaxError as error:
+            # check whether it's a conditional statement
+            keyword = s.split()[0]
+            if keyword not in ["if", "else:", "while"]:
+                raise error
+
+        if not s.endswith(":"):
+            raise SyntaxError("Header must end with :")
+
+        if keyword == "else:":
+            self.keyword = "else"
+        else:
+            self.keyword = keyword
+            condition = s[len(keyword) : -1].strip()
+            self.code = compile(condition, "<user-provided code>", "eval")
+
+
+def count_spaces(source):
+    """Returns the number of leading spaces after expanding tabs."""
+    s = source.expandtabs(4)
+    t = s.lstrip(" ")
+    return len(s) - len(t)
+
+
 class Thread:
     """Represents simulated threads."""
 
@@ -712,6 +1529,16 @@ class Thread:
         self.row.remove_thread(self)
         self.row = None
 
+    def remove(self):
+        """Removes this thread from the display and the simulator."""
+        if self.row:
+            if self.queued:
+                self.row.dequeue_thread(self)
+            else:
+                self.row.remove_thread(self)
+            self.row = None
+        self.sync.unregister(self)
+
     def start(self):
         """Moves this thread to the top of the column."""
         self.queued = False
@@ -738,33 +1565,23 @@ class Thread:
         # get the next line
         # compute the change in indent
         # find the outdent
-        source = self.row.get()
-        head_indent = self.count_spaces(source)
+        head = self.row
+        head_indent = head.get_line().indent
 
         self.next_row()
-        source = self.row.get()
-        body_indent = self.count_spaces(source)
+        body_indent = self.row.get_line().indent
 
         indent = body_indent - head_indent
 
         if indent <= 0:
             raise SyntaxError("Body of compound statement must be indented.")
 
-        while True:
-            self.next_row()
-            if self.row == None:
-                break
-
-            source = self.row.get()
-            line_indent = self.count_spaces(source)
-            if line_indent <= head_indent:
-                break
+        # the column knows where the block ends
+        self.jump_to(self.column.end_of_block(head))
 
     def count_spaces(self, source):
         """Returns the number of leading spaces after expanding tabs."""
-        s = source.expandtabs(4)
-        t = s.lstrip(" ")
-        return len(s) - len(t)
+        return count_spaces(source)
 
     def step(self, event=None):
         """Executes the current line of code, then moves to the next row.
@@ -787,22 +1604,33 @@ class Thread:
             return None
 
         self.check_end_while()
-        source = self.row.get()
-        print(self, source)
+        row = self.row
+        line = row.get_line()
+        source = line.source
+        if self.sync.verbose:
+            print(self, source)
+
+        self.sync.begin_step()
+        trace = self.sync.trace
+        if trace is not None:
+            queued = [thread.queued for thread in self.sync.threads]
 
-        before = copy.copy(self.sync.locals)
+        locals = self.sync.locals
+        locals.clear_writes()
 
-        flag = self.exec_line(source, self.sync)
+        flag = self.run_line(line, self.sync)
 
         # see if any variables were defined or changed
-        after = self.sync.locals
-        defined, changed = diff_dict(after, before)
+        written = locals.writes()
 
-        for key in defined:
+        for key in locals.defined:
             self.sync.views[key] = self.row
 
-        if defined or changed:
-            self.sync.update_views()
+        if written:
+            self.sync.update_views(written)
+
+        if trace is not None:
+            trace.write_step(self, row, queued, written)
 
         # either skip to the next line or to the end of a false conditional
         if flag:
@@ -823,71 +1651,57 @@ class Thread:
             if the line is an if statement, returns the result of
             evaluating the condition
         """
-        global current_thread
-        current_thread = self
+        return self.run_line(Line(source), sync)
+
+    def run_line(self, line, sync):
+        """Runs a compiled Line in the context of the given Sync.
+
+        Args:
+            line: Line object
+            sync: Sync object
+
+        Returns:
+            if the line is an if statement, returns the result of
+            evaluating the condition
+        """
+        sync.current_thread = self
+        running_thread.set(self)
 
         sync.globals["self"] = self.namespace
 
-        try:
-            s = source.strip()
-            code = compile(s, "<user-provided code>", "exec")
-            exec(code, sync.globals, sync.locals)
+        if line.keyword is None:
+            exec(line.code, sync.globals, sync.locals)
             return True
-        except SyntaxError as error:
-            # check whether it's a conditional statement
-            keyword = s.split()[0]
-            if keyword in ["if", "else:", "while"]:
-                flag = self.handle_conditional(keyword, source, sync)
-                return flag
-            else:
-                raise error
+        return self.handle_conditional(line, sync)
 
-    def handle_conditional(self, keyword, source, sync):
+    def handle_conditional(self, line, sync):
         """Evaluates the condition part of an if statement.
 
         Args:
-            keyword: if, else or while
-            source: source code from a Row
+            line: Line object for an if, else or while
             sync: Sync object
 
         Returns:
             if the line is an if statement, returns the result of
             evaluating the condition; otherwise raises a SyntaxError
         """
-        s = source.strip()
-        if not s.endswith(":"):
-            raise SyntaxError("Header must end with :")
-
-        if keyword in ["if"]:
-            # evaluate the condition
-            n = len(keyword)
-            condition = s[n:-1].strip()
-            flag = eval(condition, sync.globals, sync.locals)
-
-            # store the flag
-            indent = self.count_spaces(source)
-            self.flag_map[indent] = flag
-
+        if line.keyword == "if":
+            # evaluate the condition and store the flag
+            flag = eval(line.code, sync.globals, sync.locals)
+            self.flag_map[line.indent] = flag
             return flag
 
-        elif keyword in ["while"]:
+        elif line.keyword == "while":
             # evaluate the condition
-            n = len(keyword)
-            condition = s[n:-1].strip()
-            flag = eval(condition, sync.globals, sync.locals)
-
+            flag = eval(line.code, sync.globals, sync.locals)
             if flag:
-                indent = self.count_spaces(source)
-                self.while_stack.append((indent, self.row))
-
+                self.while_stack.append((line.indent, self.row))
             return flag
 
         else:
-            assert keyword == "else:"
             # see whether the condition was true
-            indent = self.count_spaces(source)
             try:
-                flag = self.flag_map[indent]
+                flag = self.flag_map[line.indent]
                 return not flag
             except KeyError:
                 raise SyntaxError("else does not match if")
@@ -902,8 +1716,7 @@ class Thread:
 
         indent, row = self.while_stack[-1]
 
-        source = self.row.get()
-        if self.count_spaces(source) <= indent:
+        if self.row.get_line().indent <= indent:
             self.while_stack.pop()
             self.jump_to(row)
 
@@ -919,7 +1732,843 @@ class Thread:
                 break
 
 
+"""
+The following classes check a program without the GUI: Explorer
+runs the same Threads and semaphores on CodeColumns and CodeRows,
+which have no display, and tries every interleaving.
+"""
+
+
+class CodeRow(object):
+    """A row of code with no display.
+
+    Attributes:
+        text: the line of code
+        index: position of the row in its column
+        critical: True if the line is marked as a critical section
+        block: CodeBlock the row comes from, or None
+        line: compiled Line, made on demand
+    """
+
+    def __init__(self, text, index, block=None):
+        self.text = text
+        self.index = index
+        self.critical = "critical section" in text.lower()
+        self.block = block
+        self.line = None
+
+    def get(self):
+        return self.text
+
+    def get_line(self):
+        """Returns the compiled Line for this row."""
+        if self.line is None:
+            if self.block is None:
+                self.line = Line(self.text)
+            else:
+                self.line = self.block.get_line(self.index)
+        return self.line
+
+    def add_thread(self, thread):
+        pass
+
+    def remove_thread(self, thread):
+        pass
+
+    def enqueue_thread(self, thread):
+        pass
+
+    def dequeue_thread(self, thread):
+        pass
+
+
+class CodeColumn(object):
+    """A column of CodeRows, with the interface Thread expects."""
+
+    def __init__(self, p, block):
+        """Makes a column for a CodeBlock."""
+        self.p = p
+        self.rows = [CodeRow(line, i, block) for i, line in enumerate(block.lines)]
+        self.table = RowTable(self.rows, block.indents, block.ends)
+
+    def num_rows(self):
+        return len(self.rows)
+
+    def create_thread(self):
+        return Thread(self)
+
+    def next_row(self, row):
+        if row is None:
+            return self.rows[0]
+
+        try:
+            return self.rows[row.index + 1]
+        except IndexError:
+            return None
+
+    def end_of_block(self, row):
+        """Returns the first row after the block row starts, or None."""
+        return self.table.end_of_block(row)
+
+    def row_index(self, row):
+        """Returns the position of row in the column."""
+        return row.index
+
+
+class Finding(object):
+    """Something wrong that Explorer found.
+
+    Attributes:
+        kind: "deadlock", "violation", "starvation" or "error"
+        trace: list of (thread name, choices) steps that gets there
+               from the initial state (see Explorer.replay)
+        threads: list of names of the threads involved
+        loop: for starvation, the index in trace where the cycle
+              starts; trace[loop:] can repeat forever
+        error: for errors, the exception
+    """
+
+    def __init__(self, kind, trace, threads, loop=None, error=None):
+        self.kind = kind
+        self.trace = trace
+        self.threads = threads
+        self.loop = loop
+        self.error = error
+
+    def __str__(self):
+        t = ["%s: %s" % (self.kind, " ".join(self.threads))]
+        if self.error is not None:
+            t.append("  %s: %s" % (type(self.error).__name__, self.error))
+        if self.loop is None:
+            t.append("  trace: %s" % format_trace(self.trace))
+        else:
+            t.append("  trace: %s" % format_trace(self.trace[: self.loop]))
+            t.append("  cycle: %s" % format_trace(self.trace[self.loop :]))
+        return "\n".join(t)
+
+
+class Report(object):
+    """The results of Explorer.explore.
+
+    Attributes:
+        findings: list of Findings, in the order they were found
+        states: number of distinct states visited
+        complete: False if the search hit max_depth or max_states,
+                  in which case there might be more to find
+    """
+
+    def __init__(self, max_reports=10):
+        self.max_reports = max_reports
+        self.findings = []
+        self.states = 0
+        self.complete = True
+
+    def add(self, finding):
+        """Adds a finding, unless there are enough of its kind."""
+        if len(self.get(finding.kind)) < self.max_reports:
+            self.findings.append(finding)
+
+    def get(self, kind):
+        """Returns the findings of the given kind."""
+        return [finding for finding in self.findings if finding.kind == kind]
+
+    def __str__(self):
+        status = "complete" if self.complete else "incomplete"
+        t = ["%d states (%s)" % (self.states, status)]
+        t.extend(str(finding) for finding in self.findings)
+        if not self.findings:
+            t.append("no problems found")
+        return "\n".join(t)
+
+
+def format_trace(trace):
+    """Formats a trace as a string like "A B A:1 C".
+
+    Choices made during a step follow the thread name, separated
+    by colons.
+    """
+    return " ".join(":".join([name] + [str(i) for i in choices]) for name, choices in trace)
+
+
+def parse_trace(s):
+    """Parses a string made by format_trace."""
+    trace = []
+    for word in s.split():
+        t = word.split(":")
+        trace.append((t[0], tuple(int(i) for i in t[1:])))
+    return trace
+
+
+class FuzzReport(object):
+    """Statistics from many runs of Explorer.random_run.
+
+    Attributes:
+        runs: number of runs
+        steps: total number of steps
+        counts: map from kind of finding to the number of runs
+                that ended with it
+        first: map from kind of finding to (seed, Finding) for the
+               lowest seed that found it
+        progress: map from thread name to the number of steps it ran
+        max_queue: map from semaphore name to its longest queue
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.steps = 0
+        self.counts = {}
+        self.first = {}
+        self.progress = {}
+        self.max_queue = {}
+
+    def count_step(self, thread, semaphores):
+        """Records a step by a thread.
+
+        A queue only gets longer when the thread that just ran
+        blocks, so that's the only time to check the semaphores.
+        """
+        name = thread.name
+        self.progress[name] = self.progress.get(name, 0) + 1
+        if not thread.queued:
+            return
+
+        for key, semaphore in semaphores:
+            n = len(semaphore.queue)
+            if n > self.max_queue.get(key, 0):
+                self.max_queue[key] = n
+
+    def add_run(self, seed, steps, finding):
+        """Records the end of a run."""
+        self.runs += 1
+        self.steps += steps
+        if finding is None:
+            return
+
+        kind = finding.kind
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if kind not in self.first or seed < self.first[kind][0]:
+            self.first[kind] = seed, finding
+
+    def update(self, other):
+        """Adds in the results from another FuzzReport."""
+        self.runs += other.runs
+        self.steps += other.steps
+        for kind, n in other.counts.items():
+            self.counts[kind] = self.counts.get(kind, 0) + n
+        for kind, (seed, finding) in other.first.items():
+            if kind not in self.first or seed < self.first[kind][0]:
+                self.first[kind] = seed, finding
+        for name, n in other.progress.items():
+            self.progress[name] = self.progress.get(name, 0) + n
+        for key, n in other.max_queue.items():
+            self.max_queue[key] = max(n, self.max_queue.get(key, 0))
+
+    def rate(self, kind):
+        """Returns the fraction of runs that ended with the given kind."""
+        return self.counts.get(kind, 0) / float(self.runs or 1)
+
+    def __str__(self):
+        t = ["%d runs, %d steps" % (self.runs, self.steps)]
+        for kind, n in sorted(self.counts.items()):
+            seed, finding = self.first[kind]
+            t.append("%s: %d runs (%.2f%%), first at seed %d" % (kind, n, 100 * self.rate(kind), seed))
+            t.append(str(finding))
+        progress = " ".join("%s=%d" % item for item in sorted(self.progress.items()))
+        t.append("steps per thread: %s" % progress)
+        queues = " ".join("%s=%d" % item for item in sorted(self.max_queue.items()))
+        t.append("longest queues: %s" % queues)
+        return "\n".join(t)
+
+
+class Explorer(Scheduler):
+    """Checks a synchronization program by trying every interleaving.
+
+    Explorer provides the parts of the Sync interface that Threads
+    use, so the simulator's Threads and semaphores behave exactly
+    as they do in the GUI.  Each step runs one line of one thread;
+    when a step makes a random choice (like which thread a Semaphore
+    wakes up), Explorer tries each possibility.
+
+    The search is depth-first, and it does not revisit states it
+    has seen before.  It looks for deadlocks (no thread can run),
+    violations (more than critical_limit threads at rows marked
+    "critical section"), starvation (a cycle of steps during which
+    some thread stays blocked) and errors in the code.
+
+    Attributes:
+        program: Program, as from load_program
+        blocks: list of blocks of code, as from read_blocks; the
+                first is the initialization code
+        counts: number of threads to make for each block after the first
+        max_depth: longest trace to explore
+        max_states: largest number of states to visit
+        critical_limit: number of threads allowed in a critical section
+        verbose: whether to print lines as they execute
+    """
+
+    def __init__(
+        self,
+        filename,
+        threads=1,
+        max_depth=500,
+        max_states=100000,
+        critical_limit=1,
+        max_reports=10,
+    ):
+        """Makes an Explorer.
+
+        Args:
+            filename: file of code in the format Sync reads
+            threads: number of threads per column, or a list with
+                     a number for each column
+            max_depth, max_states, critical_limit: see above
+            max_reports: number of findings of each kind to report
+        """
+        self.program = load_program(filename)
+        self.blocks = [list(block.text) for block in self.program.blocks]
+
+        n = len(self.blocks) - 1
+        if isinstance(threads, int):
+            threads = [threads] * n
+        if len(threads) != n:
+            raise ValueError("Need a number of threads for each of %d columns." % n)
+        self.counts = threads
+
+        self.max_depth = max_depth
+        self.max_states = max_states
+        self.critical_limit = critical_limit
+        self.max_reports = max_reports
+        self.filename = filename
+        self.verbose = False
+
+        blocks = self.program.blocks
+        self.topcol = CodeColumn(self, blocks[0])
+        self.cols = [CodeColumn(self, block) for block in blocks[1:]]
+
+        # the column of each thread, in the order they are made
+        self.order = []
+        for i, n in enumerate(self.counts):
+            if self.cols[i].num_rows():
+                self.order.extend([i] * n)
+
+    # the following methods are the Sync interface that Threads use
+
+    def get_name(self, name=None):
+        return self.namer.next(name)
+
+    def register(self, thread):
+        self.threads.append(thread)
+
+    def unregister(self, thread):
+        self.threads.remove(thread)
+
+    def update_views(self, keys=None):
+        pass
+
+    # the rest is the explorer
+
+    def reset(self):
+        """Runs the initialization code and makes the threads."""
+        self.namer = Namer()
+        self.locals = Locals()
+        self.globals = copy.copy(sim_globals)
+        self.current_thread = None
+        self.views = {}
+        self.threads = []
+        self.script = ()
+        self.begin_step()
+
+        if self.topcol.num_rows():
+            thread = Thread(self.topcol, name="0")
+            thread.run()
+            self.unregister(thread)
+
+        for i in self.order:
+            self.cols[i].create_thread()
+
+    def save(self):
+        """Returns a copy of the current state.
+
+        The rows, columns and globals are shared, not copied.
+        """
+        return copy.deepcopy((self.locals, self.threads), self.shared())
+
+    def restore(self, snapshot):
+        """Makes a saved state current; snapshot can be used again."""
+        self.locals, self.threads = copy.deepcopy(snapshot, self.shared())
+
+    def shared(self):
+        """Makes a deepcopy memo for the parts of the state that don't change."""
+        memo = {id(self): self, id(self.globals): self.globals}
+        for col in [self.topcol] + self.cols:
+            memo[id(col)] = col
+            for row in col.rows:
+                memo[id(row)] = row
+        return memo
+
+    def fingerprint(self):
+        """Returns a hashable summary of the current state."""
+        threads = tuple(
+            (
+                thread.name,
+                thread.row.index if thread.row else None,
+                thread.queued,
+                canonical(thread.flag_map),
+                tuple((indent, row.index) for indent, row in thread.while_stack),
+                canonical(vars(thread.namespace)),
+            )
+            for thread in self.threads
+        )
+        return threads, canonical(dict(self.locals))
+
+    def run_step(self, name, script):
+        """Runs one line of the named thread.
+
+        Args:
+            name: thread name
+            script: list of choices to make, by index; choices
+                    past the end of the script are 0
+
+        Returns:
+            list of choices made
+        """
+        self.script = script
+        self.find_thread(name).step_loop()
+        return self.made
+
+    def explore(self):
+        """Searches all interleavings and returns a Report."""
+        self.report = Report(self.max_reports)
+        self.visited = set()
+        self.path = {}
+        self.blocked = []
+
+        self.reset()
+        self.search(self.save(), self.fingerprint(), [])
+        self.report.states = len(self.visited)
+        return self.report
+
+    def search(self, snapshot, key, trace):
+        """Explores the state saved in snapshot, and its successors.
+
+        Args:
+            snapshot: saved state
+            key: fingerprint of the state
+            trace: list of steps that got here
+        """
+        report = self.report
+        if key in self.path:
+            self.check_cycle(trace, self.path[key])
+            return
+        if key in self.visited:
+            return
+        if len(self.visited) >= self.max_states:
+            report.complete = False
+            return
+
+        self.restore(snapshot)
+        finding = self.check_state(trace)
+        if finding:
+            self.visited.add(key)
+            report.add(finding)
+            return
+
+        # a state at the depth limit might be reached again by a
+        # shorter path, so it doesn't count as visited
+        if len(trace) >= self.max_depth:
+            report.complete = False
+            return
+
+        self.visited.add(key)
+        self.path[key] = len(trace)
+        self.blocked.append(set(t.name for t in self.threads if t.queued))
+
+        runnable = [t.name for t in self.threads if not t.queued]
+        for name in runnable:
+            script = []
+            while script is not None:
+                self.restore(snapshot)
+                try:
+                    made = self.run_step(name, script)
+                except Exception as error:
+                    step = (name, tuple(self.made))
+                    report.add(Finding("error", trace + [step], [name], error=error))
+                    break
+
+                script = next_script(made, self.ranges)
+                step = (name, tuple(made))
+                child = self.fingerprint()
+                if child in self.visited and child not in self.path:
+                    continue
+                self.search(self.save(), child, trace + [step])
+
+        self.blocked.pop()
+        del self.path[key]
+
+    def check_state(self, trace):
+        """Checks the current state for violations and deadlock.
+
+        Args:
+            trace: steps that got here
+
+        Returns:
+            Finding or None
+        """
+        critical = [t.name for t in self.threads if t.row and t.row.critical]
+        if len(critical) > self.critical_limit:
+            return Finding("violation", trace, critical)
+
+        for thread in self.threads:
+            if not thread.queued:
+                return None
+
+        names = [t.name for t in self.threads]
+        return Finding("deadlock", trace, names)
+
+    def check_cycle(self, trace, loop):
+        """Checks a cycle for threads that stay blocked all the way around.
+
+        Args:
+            trace: steps from the initial state back to a state
+                   on the current path
+            loop: index in trace where the cycle starts
+        """
+        starved = set.intersection(*self.blocked[loop:])
+        if starved:
+            names = sorted(starved)
+            self.report.add(Finding("starvation", trace, names, loop=loop))
+
+    def random_run(self, seed, steps=1000, stats=None):
+        """Starts over and runs a random schedule.
+
+        Like Sync.random_step, each step runs a random thread that is
+        not blocked, and choices inside a step are random, too.
+
+        Args:
+            seed: seed for the random number generator
+            steps: largest number of steps to run
+            stats: FuzzReport to update with the results, or None
+
+        Returns:
+            Finding, or None if nothing went wrong
+        """
+        rng = random.Random(seed)
+        self.reset()
+        semaphores = find_semaphores(self.locals)
+        trace = []
+        finding = None
+
+        self.rng = rng
+        try:
+            for i in range(steps):
+                finding = self.check_state(trace)
+                if finding:
+                    break
+
+                runnable = [t for t in self.threads if not t.queued]
+                thread = rng.choice(runnable)
+                try:
+                    made = self.run_step(thread.name, [])
+                except Exception as error:
+                    step = (thread.name, tuple(self.made))
+                    finding = Finding("error", trace + [step], [thread.name], error=error)
+                    break
+                trace.append((thread.name, tuple(made)))
+
+                if stats is not None:
+                    stats.count_step(thread, semaphores)
+        finally:
+            self.rng = None
+
+        if stats is not None:
+            stats.add_run(seed, len(trace), finding)
+        return finding
+
+    def replay(self, trace):
+        """Starts over and runs the steps in a trace.
+
+        Args:
+            trace: list of (name, choices) or a string from format_trace
+
+        Returns:
+            list of threads in the final state
+        """
+        if isinstance(trace, str):
+            trace = parse_trace(trace)
+        self.reset()
+        for name, choices in trace:
+            self.run_step(name, list(choices))
+        return self.threads
+
+    def replay_file(self, filename):
+        """Starts over with the threads in a trace file and runs its events.
+
+        The trace can come from Sync.record, so a run in the GUI
+        can be checked here.
+
+        Returns:
+            list of threads in the final state
+        """
+        header, events = read_trace(filename)
+        self.order = [col for name, col in header["threads"]]
+        self.reset()
+        for event in events:
+            self.replay_event(event)
+        return self.threads
+
+
+class TraceWriter(object):
+    """Writes a trace of a run, one JSON object per line.
+
+    The first line describes the start: the program, and the name and
+    column of each thread, in the order they were made:
+
+        {"program":"mutex.py","threads":[["A",0],["B",0]]}
+
+    Each line after that is a step, with the index of the row that
+    ran, the choices made, the variables that changed and the threads
+    that blocked or woke up; or it is the creation of a thread:
+
+        {"step":"B","row":0,"blocked":["B"]}
+        {"step":"A","row":2,"choices":[0],"vars":{"mutex":"0"},"woken":["B"]}
+        {"create":1,"thread":"C"}
+
+    Keys with nothing to say are left out.
+    """
+
+    def __init__(self, filename, sync, buffering=65536):
+        self.fp = open(filename, "w", buffering=buffering)
+        threads = [[thread.name, sync.cols.index(thread.column)] for thread in sync.threads]
+        self.write(dict(program=sync.filename, threads=threads))
+
+    def write(self, event):
+        self.fp.write(json.dumps(event, separators=(",", ":")))
+        self.fp.write("\n")
+
+    def write_step(self, thread, row, queued, keys):
+        """Writes a step.
+
+        Args:
+            thread: Thread that ran
+            row: row that ran
+            queued: list of whether each thread was queued before the step
+            keys: names of the variables the step assigned or modified
+        """
+        sync = thread.sync
+        event = {"step": thread.name, "row": thread.column.row_index(row)}
+        if sync.made:
+            event["choices"] = sync.made
+
+        if keys:
+            event["vars"] = dict((key, str(sync.locals.get(key))) for key in keys)
+
+        blocked = []
+        woken = []
+        for other, was_queued in zip(sync.threads, queued):
+            if other.queued and not was_queued:
+                blocked.append(other.name)
+            elif was_queued and not other.queued:
+                woken.append(other.name)
+        if blocked:
+            event["blocked"] = blocked
+        if woken:
+            event["woken"] = woken
+
+        self.write(event)
+
+    def write_create(self, thread):
+        """Writes the creation of a thread."""
+        col = thread.sync.cols.index(thread.column)
+        self.write({"create": col, "thread": thread.name})
+
+    def close(self):
+        self.fp.close()
+
+
+def read_trace(filename):
+    """Reads a trace file written by TraceWriter.
+
+    Returns:
+        the first line, describing the start, and a list of events
+    """
+    fp = open(filename)
+    lines = [json.loads(line) for line in fp]
+    fp.close()
+    return lines[0], lines[1:]
+
+
+def find_semaphores(locals):
+    """Finds the semaphores in the simulator's variables.
+
+    Looks at the variables and the attributes of objects they refer
+    to, so the semaphore inside a Lightswitch is found, too.
+
+    Returns:
+        list of (name, Semaphore) pairs
+    """
+    semaphores = []
+    for key, value in sorted(locals.items()):
+        if isinstance(value, Semaphore):
+            semaphores.append((key, value))
+        elif hasattr(value, "__dict__") and not isinstance(value, type):
+            for attr, x in sorted(vars(value).items()):
+                if isinstance(x, Semaphore):
+                    semaphores.append(("%s.%s" % (key, attr), x))
+    return semaphores
+
+
+def next_script(made, ranges):
+    """Returns the choices to make the next time a step runs, or None.
+
+    Counts through the combinations like an odometer, where made
+    is the current reading and ranges the number on each wheel.
+    """
+    for k in reversed(range(len(made))):
+        if made[k] + 1 < ranges[k]:
+            return made[:k] + [made[k] + 1]
+    return None
+
+
+def canonical(value, seen=None):
+    """Returns a hashable form of a value in the simulator.
+
+    Threads are represented by name and semaphores by their count
+    and queue; other objects by their class and attributes.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return value
+    if isinstance(value, Thread):
+        return ("Thread", value.name)
+    if isinstance(value, Semaphore):
+        names = [thread.name for thread in value.waiting()]
+        if not value.ordered:
+            names.sort()
+        return (type(value).__name__, value.n, tuple(names))
+
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return ("cycle",)
+    seen.add(id(value))
+
+    if isinstance(value, (list, tuple)):
+        result = tuple(canonical(x, seen) for x in value)
+    elif isinstance(value, (set, frozenset)):
+        result = ("set",) + tuple(sorted((canonical(x, seen) for x in value), key=repr))
+    elif isinstance(value, dict):
+        items = [(key, canonical(x, seen)) for key, x in value.items()]
+        result = ("dict",) + tuple(sorted(items, key=repr))
+    elif isinstance(value, type) or callable(value):
+        result = ("callable", getattr(value, "__qualname__", repr(value)))
+    elif hasattr(value, "__dict__"):
+        result = (type(value).__name__, canonical(vars(value), seen))
+    else:
+        result = repr(value)
+
+    seen.discard(id(value))
+    return result
+
+
+def fuzz(filename, runs, steps=1000, seed=0, processes=None, **options):
+    """Runs many random schedules, in parallel, and collects statistics.
+
+    Args:
+        filename: file of code in the format Sync reads
+        runs: number of schedules
+        steps: largest number of steps in each schedule
+        seed: seed of the first schedule; the rest count up from here
+        processes: number of worker processes (default one per CPU);
+                   with 1, everything runs in this process
+        options: passed along to Explorer
+
+    Returns:
+        FuzzReport
+    """
+    seeds = range(seed, seed + runs)
+    if processes == 1:
+        return fuzz_seeds((filename, options, seeds, steps))
+
+    import multiprocessing
+
+    processes = processes or multiprocessing.cpu_count()
+    size = max(1, min(1000, runs // (4 * processes)))
+    jobs = [
+        (filename, options, seeds[i : i + size], steps)
+        for i in range(0, runs, size)
+    ]
+
+    stats = FuzzReport()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for report in pool.imap_unordered(fuzz_seeds, jobs):
+            stats.update(report)
+    finally:
+        pool.close()
+        pool.join()
+    return stats
+
+
+def fuzz_seeds(job):
+    """Runs the schedules for one job from fuzz.
+
+    Args:
+        job: tuple of filename, Explorer options, seeds and steps
+
+    Returns:
+        FuzzReport
+    """
+    filename, options, seeds, steps = job
+    explorer = Explorer(filename, **options)
+    stats = FuzzReport()
+    for seed in seeds:
+        explorer.random_run(seed, steps, stats)
+    return stats
+
+
+def check(options, args):
+    """Checks the programs named in args and prints a report for each.
+
+    Explores every interleaving or, with the fuzz option, runs
+    random schedules.
+    """
+    threads = [int(n) for n in options.threads.split(",")]
+    if len(threads) == 1:
+        threads = threads[0]
+
+    for filename in args:
+        if len(args) > 1:
+            print("== %s" % filename)
+        try:
+            check_file(filename, options, threads)
+        except (OSError, ValueError) as error:
+            print(error)
+
+
+def check_file(filename, options, threads):
+    """Checks one program (see check)."""
+    if options.fuzz:
+        stats = fuzz(
+            filename,
+            options.fuzz,
+            options.steps,
+            options.seed,
+            options.processes,
+            threads=threads,
+            critical_limit=options.limit,
+        )
+        print(stats)
+        return
+
+    explorer = Explorer(filename, threads=threads, critical_limit=options.limit)
+    print(explorer.explore())
+
+
 def main():
+    (options, args) = make_parser().parse_args(sys.argv[1:])
+    if options.check or options.fuzz:
+        check(options, args)
+        return
+
     sync = Sync(sys.argv[1:])
     sync.mainloop()
 
@@ -5,16 +5,34 @@ Copyright 2011 Allen B. Downey
 Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
 """
 
+from array import array
+from collections import deque
+from operator import add
+
 from tkinter import END
-from .CellWorld import CellWorld
+from .CellWorld import CellWorld, CellGrid, TiledGrid
 from .World import Animal, Interpreter
 
 
 class TurmiteWorld(CellWorld):
     """Provides a grid of cells that Turmites occupy."""
 
-    def __init__(self, canvas_size=600, cell_size=5):
-        CellWorld.__init__(self, canvas_size, cell_size)
+    def __init__(
+        self,
+        canvas_size=600,
+        cell_size=5,
+        grid_size=None,
+        tile_size=None,
+        backend=None,
+    ):
+        CellWorld.__init__(
+            self,
+            canvas_size,
+            cell_size,
+            grid_size=grid_size,
+            tile_size=tile_size,
+            backend=backend,
+        )
         self.title("TurmiteWorld")
 
         # the interpreter executes user-provided code
@@ -66,10 +84,146 @@ class TurmiteWorld(CellWorld):
         """Removes all the animals and all the cells."""
         for animal in self.animals:
             animal.undraw()
-        for cell in list(self.cells.values()):
-            cell.undraw()
         self.animals = []
-        self.cells = {}
+        self.clear_cells()
+
+    def fast_forward(self, n):
+        """Advances the turmites n steps without drawing, then redraws.
+
+        Each step, every turmite moves once, in the order they were
+        created, just like step.  If a turmite walks off the grid,
+        it stops there, and so do the others.
+
+        Precondition: the world has a CellGrid or TiledGrid (see
+        make_grid and make_tiled_grid).
+
+        Args:
+            n: number of steps
+
+        Returns:
+            number of steps completed
+        """
+        if self.cell_grid is None:
+            raise ValueError("fast_forward requires a CellGrid or TiledGrid.")
+
+        turmites = [animal for animal in self.animals if isinstance(animal, Turmite)]
+        batches = [animal for animal in self.animals if isinstance(animal, TurmiteBatch)]
+
+        steps = n
+        if turmites:
+            for turmite in turmites:
+                self.set_colors(turmite.rule)
+            engine = TurmiteEngine(self.cell_grid, turmites)
+            steps = engine.run(n)
+            engine.sync()
+
+        # batches run after the individual turmites, which only
+        # matters if they visit the same cells
+        for batch in batches:
+            self.set_colors(batch.rule)
+            steps = min(steps, batch.run(n))
+
+        if self.exists:
+            for animal in turmites + batches:
+                animal.redraw()
+            self.flush()
+        return steps
+
+    def advance(self, n):
+        """Takes n steps, drawing only at the end.
+
+        If every animal is a Turmite or TurmiteBatch and the world has
+        a grid, uses fast_forward; if a turmite leaves the grid,
+        stops running.
+        """
+        kinds = (Turmite, TurmiteBatch)
+        if self.cell_grid is None or not all(isinstance(a, kinds) for a in self.animals):
+            CellWorld.advance(self, n)
+            return
+
+        if self.fast_forward(n) < n:
+            self.stop()
+
+    def set_colors(self, rule):
+        """Chooses fill colors for the cell states a rule uses."""
+        for color in range(2, rule.num_colors):
+            self.cell_grid.colors.setdefault(color, PALETTE[color % len(PALETTE)])
+
+
+# fill colors for cell states; 0 and 1 are usually drawn with the
+# unmarked and marked options, but TurmiteRules can use more states
+PALETTE = ["yellow", "black", "red", "blue", "green", "orange", "purple", "cyan"]
+
+
+class TurmiteRule(object):
+    """A transition table for a turmite.
+
+    The table maps from (state, color) to (color, turn, state), where
+    state is the internal state of the turmite, color is the state
+    of the cell it is on, and turn is one of "L", "R", "N" (no turn)
+    or "U" (u-turn).  At each step, the turmite writes the new color
+    into its cell, turns, changes state and moves forward.
+
+    Attributes:
+        num_states: number of turmite states
+        num_colors: number of cell states
+        colors, turns, states: lists that flatten the table; the
+            entry for (state, color) is at state * num_colors + color,
+            and turns contains the change in dir.
+        bases: list of the new states times num_colors, which is where
+            the next entry starts
+    """
+
+    turn_codes = dict(N=0, L=1, U=2, R=3)
+
+    def __init__(self, table):
+        self.table = dict(table)
+
+        states = set()
+        colors = set()
+        for (state, color), (new_color, turn, new_state) in self.table.items():
+            states.update([state, new_state])
+            colors.update([color, new_color])
+        self.num_states = max(states) + 1
+        self.num_colors = max(colors) + 1
+
+        self.colors = []
+        self.turns = []
+        self.states = []
+        for state in range(self.num_states):
+            for color in range(self.num_colors):
+                try:
+                    new_color, turn, new_state = self.table[state, color]
+                except KeyError:
+                    raise ValueError(
+                        "TurmiteRule has no entry for %s." % str((state, color))
+                    )
+                self.colors.append(new_color)
+                self.turns.append(self.turn_codes[turn])
+                self.states.append(new_state)
+        self.bases = [state * self.num_colors for state in self.states]
+
+    @staticmethod
+    def from_string(turns):
+        """Makes a rule for a generalized ant with one state.
+
+        When the ant lands on a cell with color c, it turns according
+        to turns[c] and advances the cell to the next color.  Langton's
+        ant is "RL".
+        """
+        n = len(turns)
+        table = {}
+        for color, turn in enumerate(turns):
+            table[0, color] = ((color + 1) % n, turn, 0)
+        return TurmiteRule(table)
+
+    def lookup(self, state, color):
+        """Returns the (color, change in dir, state) for a turmite."""
+        e = state * self.num_colors + color
+        return self.colors[e], self.turns[e], self.states[e]
+
+
+LANGTON = TurmiteRule.from_string("RL")
 
 
 class Turmite(Animal):
@@ -77,17 +231,25 @@ class Turmite(Animal):
 
     Attributes:
         dir: direction, one of [0, 1, 2, 3]
+        rule: TurmiteRule
+        state: internal state used by the rule
     """
 
-    def __init__(self, world):
+    def __init__(self, world, rule=LANGTON):
         Animal.__init__(self, world)
         self.dir = 0
+        self.rule = rule
+        self.state = 0
         self.draw()
 
     def draw(self):
         """Draw the Turmite."""
+        # make sure there is a cell to draw on; grid cells always
+        # exist, and the turmite may have walked off the grid
+        if self.world.cell_grid is None:
+            self.get_cell()
+
         # get the bounds of the cell
-        cell = self.get_cell()
         bounds = self.world.cell_bounds(self.x, self.y)
 
         # draw a triangle inside the cell, pointing in the
@@ -128,19 +290,288 @@ class Turmite(Animal):
         return world.get_cell(x, y) or world.make_cell(x, y)
 
     def step(self):
-        """Implements the rules for Langton's Ant.
+        """Implements the rule for this turmite.
 
+        By default, the rule is Langton's Ant.
         (see http://mathworld.wolfram.com/LangtonsAnt.html)
         """
         cell = self.get_cell()
-        if cell.is_marked():
-            self.lt()
-        else:
-            self.rt()
-        cell.toggle()
+        color, turn, self.state = self.rule.lookup(self.state, cell.get_state())
+        self.dir = (self.dir + turn) % 4
+        cell.set_state(color)
         self.fd()
 
 
+class TurmiteEngine(object):
+    """Advances Turmites on a CellGrid or TiledGrid without drawing anything.
+
+    The engine copies the position, direction and state of each
+    turmite into a list, runs the rules directly on the bytearray
+    in the grid (or the tile the turmite is on), and copies the
+    results back when sync is invoked.
+    """
+
+    # change in i for each direction; the change in the offset
+    # into the grid is di for east and west and +-width for north
+    # and south
+    di = [1, 0, -1, 0]
+
+    def __init__(self, grid, turmites):
+        self.grid = grid
+        self.turmites = turmites
+
+        # each ant is [x, y, dir, state]
+        self.ants = []
+        for turmite in turmites:
+            self.ants.append([turmite.x, turmite.y, turmite.dir, turmite.state])
+
+    def get_block(self, x, y):
+        """Returns the CellGrid that contains cell x, y, or None.
+
+        For a TiledGrid, that's the tile, which is allocated if necessary.
+        """
+        if isinstance(self.grid, TiledGrid):
+            return self.grid.get_tile(x, y, create=True)
+        if self.grid.contains(x, y):
+            return self.grid
+        return None
+
+    def run(self, n):
+        """Advances the turmites up to n steps.
+
+        Returns:
+            number of steps completed
+        """
+        if len(self.ants) == 1:
+            return self.run_ant(self.ants[0], self.turmites[0].rule, n)
+
+        pairs = list(zip(self.ants, self.turmites))
+        for step in range(n):
+            for x, y, d, state in self.ants:
+                if self.get_block(x, y) is None:
+                    return step
+            for ant, turmite in pairs:
+                self.run_ant(ant, turmite.rule, 1)
+        return n
+
+    def run_ant(self, ant, rule, n):
+        """Advances one ant up to n steps, or until it leaves the grid.
+
+        Returns:
+            number of steps completed
+        """
+        done = 0
+        while done < n:
+            x, y = ant[0], ant[1]
+            block = self.get_block(x, y)
+            if block is None:
+                break
+            done += self.run_block(block, ant, rule, n - done)
+        return done
+
+    def run_block(self, block, ant, rule, n):
+        """Advances one ant up to n steps, or until it leaves the block.
+
+        This is the inner loop, so everything it uses is a local variable.
+
+        Args:
+            block: CellGrid that contains the ant
+            ant: [x, y, dir, state] list, modified
+
+        Returns:
+            number of steps completed
+        """
+        cells = block.state
+        block.rescan = True
+        width = block.width
+        size = len(cells)
+        di = self.di
+        dk = [1, width, -1, -width]
+        colors = rule.colors
+        turns = rule.turns
+        num_colors = rule.num_colors
+        bases = rule.bases
+
+        x, y, d, state = ant
+        i = x - block.i0
+        k = (y - block.j0) * width + i
+        base = state * num_colors
+        steps = n
+        for step in range(n):
+            if not (0 <= i < width and 0 <= k < size):
+                steps = step
+                break
+            e = base + cells[k]
+            cells[k] = colors[e]
+            d = (d + turns[e]) & 3
+            base = bases[e]
+            i += di[d]
+            k += dk[d]
+
+        x = i + block.i0
+        y = (k - i) // width + block.j0
+        ant[:] = x, y, d, base // num_colors
+        return steps
+
+    def sync(self):
+        """Copies the results back into the Turmites."""
+        for (x, y, d, state), turmite in zip(self.ants, self.turmites):
+            turmite.x = x
+            turmite.y = y
+            turmite.dir = d
+            turmite.state = state
+
+
+# maps a sum of directions to a direction
+MOD4 = bytes([b & 3 for b in range(256)])
+
+
+class TurmiteBatch(Animal):
+    """A group of turmites that share a rule and move together.
+
+    Instead of one object per turmite, the positions, directions
+    and states are kept in parallel arrays, and step advances all
+    of them at once: it reads the cells under every turmite, looks
+    up the rule for all of them with bytes.translate, writes the new
+    colors and moves.
+
+    All turmites read their cells before any of them write.  So if
+    two turmites are on the same cell, they both see its old color,
+    and the one that was added later writes the final color.
+
+    Precondition: the world has a CellGrid (see CellWorld.make_grid).
+
+    Attributes:
+        rule: TurmiteRule
+        k: array of offsets into the grid
+        i: array of horizontal offsets (from the left edge of the grid)
+        dir: bytearray of directions
+        base: bytearray of states, times rule.num_colors
+    """
+
+    # change in i for each direction
+    di = [1, 0, -1, 0]
+
+    def __init__(self, world, rule=LANGTON):
+        Animal.__init__(self, world)
+        self.grid = self.world.cell_grid
+        if not isinstance(self.grid, CellGrid):
+            raise ValueError("TurmiteBatch requires a CellGrid.")
+        if rule.num_states * rule.num_colors > 256:
+            raise ValueError("TurmiteBatch rules must have at most 256 entries.")
+
+        self.rule = rule
+        self.k = array("l")
+        self.i = array("l")
+        self.dir = bytearray()
+        self.base = bytearray()
+        self.tag = "TurmiteBatch%d" % id(self)
+
+        # the rule as translation tables, indexed by state * num_colors + color
+        pad = bytes(256 - len(rule.colors))
+        self.colors = bytes(rule.colors) + pad
+        self.turns = bytes(rule.turns) + pad
+        self.bases = bytes(rule.bases) + pad
+        self.draw()
+
+    def __len__(self):
+        return len(self.k)
+
+    def add(self, x=0, y=0, dir=0, state=0):
+        """Adds a turmite at cell x, y."""
+        grid = self.grid
+        i = x - grid.i0
+        self.k.append((y - grid.j0) * grid.width + i)
+        self.i.append(i)
+        self.dir.append(dir)
+        self.base.append(state * self.rule.num_colors)
+        if self.world.exists:
+            self.draw_turmite(x, y, dir)
+
+    def get_positions(self):
+        """Returns a list of (x, y) cell indices, one for each turmite."""
+        grid = self.grid
+        res = []
+        for k, i in zip(self.k, self.i):
+            res.append((i + grid.i0, (k - i) // grid.width + grid.j0))
+        return res
+
+    def get_states(self):
+        """Returns a list of turmite states."""
+        return [base // self.rule.num_colors for base in self.base]
+
+    def on_grid(self, k=None, i=None):
+        """Checks whether all turmites are inside the grid.
+
+        Args:
+            k, i: arrays of offsets; default is self.k and self.i
+        """
+        if k is None:
+            k, i = self.k, self.i
+        if not k:
+            return True
+        return (
+            min(k) >= 0
+            and max(k) < len(self.grid.state)
+            and min(i) >= 0
+            and max(i) < self.grid.width
+        )
+
+    def step(self):
+        """Advances all turmites one step and redraws them."""
+        self.run(1)
+        self.redraw()
+
+    def run(self, n):
+        """Advances all turmites up to n steps without drawing.
+
+        Stops early if a turmite leaves the grid.
+
+        Returns:
+            number of steps completed
+        """
+        cells = self.grid.state
+        self.grid.rescan = True
+        width = self.grid.width
+        colors, turns, bases = self.colors, self.turns, self.bases
+        get, put = cells.__getitem__, cells.__setitem__
+        di = self.di.__getitem__
+        dk = [1, width, -1, -width].__getitem__
+
+        k, i, dir, base = self.k, self.i, self.dir, self.base
+        steps = n
+        for step in range(n):
+            if not self.on_grid(k, i):
+                steps = step
+                break
+
+            # look up all the cells, then write all the new colors,
+            # in order, so the last write to a cell wins
+            keys = bytes(map(add, base, map(get, k)))
+            deque(map(put, k, keys.translate(colors)), maxlen=0)
+
+            dir = bytes(map(add, dir, keys.translate(turns))).translate(MOD4)
+            base = keys.translate(bases)
+            k = array("l", map(add, k, map(dk, dir)))
+            i = array("l", map(add, i, map(di, dir)))
+
+        self.k, self.i = k, i
+        self.dir, self.base = bytearray(dir), bytearray(base)
+        return steps
+
+    def draw(self):
+        """Draws all the turmites, using one tag."""
+        for (x, y), dir in zip(self.get_positions(), self.dir):
+            self.draw_turmite(x, y, dir)
+
+    def draw_turmite(self, x, y, dir):
+        """Draws one turmite, the same way Turmite.draw does."""
+        world = self.world
+        bounds = rotate(world.cell_bounds(x, y), dir)
+        mid = vmid(bounds[1], bounds[2])
+        world.canvas.polygon([bounds[0], mid, bounds[3]], fill="red", tags=self.tag)
+
+
 # the following are some useful vector operations
 
 
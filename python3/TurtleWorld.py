@@ -9,13 +9,14 @@ from tkinter import TOP, BOTTOM, LEFT, RIGHT, END, LAST, NONE, SUNKEN
 
 from .Gui import Callable
 from .World import World, Animal, wait_for_user
+from .Figure import Figure
 
 
 class TurtleWorld(World):
     """An environment for Turtles and TurtleControls."""
 
-    def __init__(self, interactive=False):
-        World.__init__(self)
+    def __init__(self, interactive=False, backend=None):
+        World.__init__(self, backend=backend)
         self.title("TurtleWorld")
 
         # the interpreter executes user-provided code
@@ -97,6 +98,30 @@ class TurtleWorld(World):
         self.animals = []
         self.canvas.delete("all")
 
+    def advance(self, n):
+        """Takes n steps, then flushes any batched turtles."""
+        World.advance(self, n)
+        for animal in self.animals:
+            if isinstance(animal, Turtle) and animal.batched:
+                animal.flush()
+
+
+class Stroke(object):
+    """A polyline drawn by a batched Turtle.
+
+    Attributes:
+        color: pen color
+        points: list of [x, y] points
+    """
+
+    def __init__(self, color, points):
+        self.color = color
+        self.points = points
+
+    def draw(self, canvas):
+        """Draws the stroke on the given canvas and returns the Item."""
+        return canvas.line(self.points, fill=self.color)
+
 
 class Turtle(Animal):
     """Represents a Turtle in a TurtleWorld.
@@ -108,6 +133,8 @@ class Turtle(Animal):
         heading: what direction the turtle is facing, in degrees.  0 is east.
         pen: boolean, whether the pen is down
         color: string turtle color
+        batched: boolean, whether moves are being batched
+        strokes: display list of Strokes drawn in batched mode
     """
 
     def __init__(self, world=None):
@@ -117,8 +144,78 @@ class Turtle(Animal):
         self.pen = True
         self.color = "red"
         self.pen_color = "blue"
+
+        self.batched = False
+        self.frame_size = 1000
+        self.moves = 0
+        self.strokes = []
+        self.stroke = None
+        self.pending = []
         self.draw()
 
+    def begin_batch(self, frame_size=1000):
+        """Starts recording moves instead of drawing them one at a time.
+
+        Consecutive segments drawn with the same pen color are
+        combined into one polyline, and the turtle itself is only
+        redrawn (and the world only sleeps) at the end of each frame.
+
+        Args:
+            frame_size: number of moves per frame
+        """
+        self.batched = True
+        self.frame_size = frame_size
+        self.moves = 0
+
+    def end_batch(self):
+        """Draws any pending moves and stops batching."""
+        self.flush()
+        self.batched = False
+
+    def flush(self):
+        """Draws the pending strokes and redraws the turtle."""
+        self.draw_strokes()
+        self.moves = 0
+        self.redraw()
+
+    def draw_strokes(self):
+        """Draws the strokes made since the last flush."""
+        if self.world.exists:
+            for stroke in self.pending:
+                stroke.draw(self.world.canvas)
+        self.pending = []
+        self.stroke = None
+
+    def replay(self):
+        """Draws every stroke in the display list again.
+
+        For example, after the canvas has been cleared.
+        """
+        self.pending = list(self.strokes)
+        self.draw_strokes()
+
+    def record(self, p1, p2):
+        """Adds a segment to the display list.
+
+        If it continues the current stroke in the same color, it
+        is added to that stroke; otherwise it starts a new one.
+        """
+        stroke = self.stroke
+        if stroke is None or stroke.color != self.pen_color:
+            stroke = self.stroke = Stroke(self.pen_color, [p1])
+            self.strokes.append(stroke)
+            self.pending.append(stroke)
+        stroke.points.append(p2)
+
+    def end_move(self):
+        """Counts a move in batched mode; redraws otherwise."""
+        if not self.batched:
+            self.redraw()
+            return
+        self.moves += 1
+        if self.moves >= self.frame_size:
+            self.flush()
+
     def get_x(self):
         """Returns the current x coordinate."""
         return self.x
@@ -140,7 +237,8 @@ class Turtle(Animal):
 
     def draw(self):
         """Draws the turtle."""
-        if not self.world:
+        # in a Figure, only the lines are drawn
+        if not self.world or not getattr(self.world, "show_turtles", True):
             return
 
         self.tag = "Turtle%d" % id(self)
@@ -181,9 +279,14 @@ class Turtle(Animal):
         self.x, self.y = p2
 
         # if the pen is down, draw a line
-        if self.pen and self.world.exists:
+        if self.batched:
+            if self.pen:
+                self.record(p1, p2)
+            else:
+                self.stroke = None
+        elif self.pen and self.world.exists:
             self.world.canvas.line([p1, p2], fill=self.pen_color)
-        self.redraw()
+        self.end_move()
 
     def bk(self, dist=1):
         """Moves the turtle backward by the given distance."""
@@ -192,12 +295,12 @@ class Turtle(Animal):
     def rt(self, angle=90):
         """Turns right by the given angle."""
         self.heading = self.heading - angle
-        self.redraw()
+        self.end_move()
 
     def lt(self, angle=90):
         """Turns left by the given angle."""
         self.heading = self.heading + angle
-        self.redraw()
+        self.end_move()
 
     def pd(self):
         """Puts the pen down (active)."""
@@ -215,12 +318,17 @@ class Turtle(Animal):
         to address that would be to make color a property.
         """
         self.color = color
-        self.redraw()
+        self.end_move()
 
     def set_pen_color(self, color):
         """Changes the pen color of the turtle."""
         self.pen_color = color
 
+    def die(self):
+        """Draws any pending strokes, then removes the turtle."""
+        self.draw_strokes()
+        Animal.die(self)
+
 
 """Add the turtle methods to the module namespace
 so they can be invoked as simple functions (not methods).
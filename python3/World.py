@@ -39,9 +39,20 @@ class World(Gui):
         # set to False when the user presses quit.
         self.exists = True
 
+        # True while run is running; stop sets it to False.
+        self.running = False
+
         # list of animals that live in this world.
         self.animals = []
 
+        # run takes steps_per_frame steps between updates of the display;
+        # if fps is set, steps_per_frame adapts to hit that frame rate.
+        self.steps_per_frame = 1
+        self.fps = None
+
+        # the task animate is running, if any
+        self.current_task = None
+
         # if the user closes the window, shut down cleanly
         self.protocol("WM_DELETE_WINDOW", self.quit)
 
@@ -65,9 +76,12 @@ class World(Gui):
         Gui.quit(self)
 
     def sleep(self):
-        """Updates the GUI and sleeps.
+        """Updates the GUI and waits for delay seconds.
+
+        While it waits, sleep processes events (see Gui.wait), so the
+        GUI stays responsive and other animations keep running.
 
-        Calling Tk.update from a function that might be invoked by
+        Processing events from a function that might be invoked by
         an event handler is generally considered a bad idea.  For
         a discussion, see http://wiki.tcl.tk/1255
 
@@ -78,12 +92,51 @@ class World(Gui):
            handler.  So any changes that happen during the update
            won't cause problems when it returns.
 
-        Sleeping is also a potential problem, since the GUI is
-        unresponsive while sleeping.  So it is probably a good idea
-        to keep delay less than about 0.5 seconds.
+        If delay is 0, sleep returns right away without updating, so
+        scripts that draw a lot run at full speed; the display catches
+        up the next time the event loop runs.  Inside a task started
+        by animate, sleep also returns right away; the task pauses
+        when it yields.
+        """
+        if not self.delay or self.current_task is not None:
+            return
+        self.wait(int(self.delay * 1000))
+
+    def animate(self, *tasks):
+        """Runs tasks concurrently, driven by the event loop.
+
+        A task is a generator (or other iterator).  Each time it yields,
+        it is suspended, and a callback scheduled with after resumes it
+        later.  A task can yield the time to wait in seconds; if it
+        yields None, it waits delay seconds.  Since sleep does not
+        block inside a task, several turtles (or worlds) can animate
+        at the same time.
+
+        animate returns right away; the tasks run when the event loop
+        does, for example in wait_for_user.
+
+        Args:
+            tasks: generators
         """
-        self.update()
-        time.sleep(self.delay)
+        for task in tasks:
+            self.after(0, self.resume, iter(task))
+
+    def resume(self, task):
+        """Runs a task until it yields, then schedules the rest."""
+        if not self.exists:
+            return
+
+        self.current_task = task
+        try:
+            delay = next(task)
+        except StopIteration:
+            return
+        finally:
+            self.current_task = None
+
+        if delay is None:
+            delay = self.delay
+        self.after(int(delay * 1000), self.resume, task)
 
     def register(self, animal):
         """Adds a new animal to the world."""
@@ -111,12 +164,65 @@ class World(Gui):
         for animal in self.animals:
             animal.step()
 
-    def run(self):
-        """Invoke step intermittently until the user presses Quit or Stop."""
+    def advance(self, n):
+        """Takes n steps, or fewer if the world is running and a
+        step invokes stop.
+
+        The display is not updated between steps, so subclasses can
+        override this method to defer drawing until the end.
+        """
+        running = self.running
+        for i in range(n):
+            self.step()
+            if running and not self.running:
+                break
+
+    def run(self, steps_per_frame=None, fps=None):
+        """Invoke step intermittently until the user presses Quit or Stop.
+
+        Each frame, run takes some steps and then updates the display
+        once, so the simulation is not limited by the speed of the GUI.
+
+        Args:
+            steps_per_frame: number of steps per frame; default is
+                             self.steps_per_frame
+            fps: target frames per second; if provided, steps_per_frame
+                 is adjusted each frame to use the time available.
+                 Default is self.fps.
+        """
+        if steps_per_frame is not None:
+            self.steps_per_frame = steps_per_frame
+        if fps is not None:
+            self.fps = fps
+
         self.running = True
         while self.exists and self.running:
-            self.step()
+            start = time.time()
+            self.advance(self.steps_per_frame)
+            middle = time.time()
             self.update()
+            if self.fps:
+                self.adapt_steps(middle - start, time.time() - middle)
+
+    def adapt_steps(self, step_time, update_time):
+        """Adjusts steps_per_frame to get closer to the target frame rate.
+
+        Args:
+            step_time: time it took to run the steps in the last frame
+            update_time: time it took to update the display
+        """
+        k = self.steps_per_frame
+        budget = 1.0 / self.fps - update_time
+        if budget <= 0:
+            target = 1
+        elif step_time <= 0:
+            target = 2 * k
+        else:
+            target = k * budget / step_time
+
+        # change gradually, at most doubling or halving each frame
+        target = min(max(target, k / 2.0), 2.0 * k)
+        self.steps_per_frame = max(1, int(target))
 
     def stop(self):
         """Stops running."""
@@ -203,6 +309,16 @@ class Animal(object):
         y: location in Canvas coordinates
     """
 
+    # unit_circle maps from angles in degrees to [cos, sin], and
+    # templates maps from tuples of angles to lists of [cos, sin].
+    # They are shared by all animals; they stop growing at
+    # max_angles and max_templates, in case the angles are all
+    # different.
+    unit_circle = {}
+    templates = {}
+    max_angles = 4096
+    max_templates = 1024
+
     def __init__(self, world=None):
         self.world = world or World.current_world
         if self.world:
@@ -265,11 +381,50 @@ class Animal(object):
         Returns:
             tuple of x, y coordinates
         """
-        rad = theta * math.pi / 180
-        s = math.sin(rad)
-        c = math.cos(rad)
+        c, s = self.unit_vector(theta)
         return [x + r * c, y + r * s]
 
+    def unit_vector(self, theta):
+        """Returns [cos, sin] of an angle in degrees, from the cache."""
+        try:
+            return Animal.unit_circle[theta]
+        except KeyError:
+            rad = theta * math.pi / 180
+            unit = [math.cos(rad), math.sin(rad)]
+            if len(Animal.unit_circle) < Animal.max_angles:
+                Animal.unit_circle[theta] = unit
+            return unit
+
+    def template(self, thetas):
+        """Returns the unit vectors for a sequence of angles, from the cache.
+
+        Args:
+            thetas: tuple of angles in degrees
+
+        Returns:
+            list of [cos, sin]
+        """
+        try:
+            return Animal.templates[thetas]
+        except KeyError:
+            template = [self.unit_vector(theta) for theta in thetas]
+            if len(Animal.templates) < Animal.max_templates:
+                Animal.templates[thetas] = template
+            return template
+
+    def shape(self, x, y, template, rs):
+        """Scales a template and moves it to (x, y).
+
+        Args:
+            x, y: location of the origin
+            template: list of unit vectors, from Animal.template
+            rs: sequence of radii, one for each vector
+
+        Returns:
+            list of [x, y] coordinates
+        """
+        return [[x + r * c, y + r * s] for r, (c, s) in zip(rs, template)]
+
 
 def wait_for_user():
     """Invokes wait_for_user on the most recent World."""
@@ -796,6 +796,26 @@ def make_color_dict(colors=COLORS):
     return d
 
 
+# map from lower case color names to RGB strings, made when first needed
+color_dict = None
+
+
+def get_rgb(color):
+    """Looks up a color name or '#RRGGBB' string.
+
+    Case doesn't matter in color names, as in Tk.
+
+    returns: tuple of r, g, b in range(256)
+    """
+    global color_dict
+    if not color.startswith("#"):
+        if color_dict is None:
+            d = make_color_dict()
+            color_dict = dict((name.lower(), rgb) for name, rgb in d.items())
+        color = color_dict[color.lower()]
+    return tuple(int(color[i : i + 2], 16) for i in (1, 3, 5))
+
+
 def read_colors():
     """Returns color information in two data structures.
 
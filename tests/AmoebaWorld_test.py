@@ -5,6 +5,8 @@ Copyright 2011 Allen B. Downey
 Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
 """
 
+import os
+import tempfile
 import unittest
 
 from swampy import AmoebaWorld
@@ -28,5 +30,110 @@ class Tests(unittest.TestCase):
         a.move(2, 3)
         aw.quit()
 
+    def test_functions(self):
+        aw = AmoebaWorld.AmoebaWorld(interactive=True, backend='headless')
+        aw.set_x_t('2*t')
+        aw.set_y_t(' math.sqrt(t)')
+        xs, ys = aw.trajectory([0, 1, 4])
+        self.assertEqual(xs, [0, 2, 8])
+        self.assertEqual(ys, [0, 1, 2])
+
+        fx, fy = aw.get_functions()
+        self.assertTrue(aw.get_functions()[0] is fx)
+        aw.set_x_t('3*t')
+        self.assertEqual(aw.get_functions()[0](1), 3)
+        self.assertEqual(len(aw.functions), 3)
+
+        # the cache stops growing at max_functions
+        aw.max_functions = 4
+        for i in range(10):
+            aw.set_x_t('%d*t' % i)
+            self.assertEqual(aw.get_functions()[0](1), i)
+        self.assertEqual(len(aw.functions), 4)
+
+        aw.set_y_t('3*')
+        aw.run()
+        self.assertFalse(aw.pending)
+        aw.quit()
+
+    def test_precompute(self):
+        aw = AmoebaWorld.AmoebaWorld(interactive=True, backend='headless')
+        a = AmoebaWorld.Amoeba()
+        aw.set_end_time('1')
+        aw.set_x_t('2*t')
+        aw.set_y_t('-t')
+        track = aw.precompute()
+        self.assertEqual(len(track), 11)
+        self.assertAlmostEqual(track.end, 1.0)
+        self.assertEqual(track.index(0.26), 3)
+        self.assertEqual(track.index(5), 10)
+
+        aw.seek(0.5)
+        self.assertAlmostEqual(a.x, 1.0)
+        self.assertAlmostEqual(a.y, -0.5)
+
+        filename = os.path.join(tempfile.mkdtemp(), 'track.csv')
+        track.write(filename)
+        lines = open(filename).read().split()
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(lines[0], 't,x,y')
+        aw.quit()
+
+    def test_play(self):
+        aw = AmoebaWorld.AmoebaWorld(interactive=True, backend='headless')
+        a = AmoebaWorld.Amoeba()
+        aw.set_end_time('1')
+
+        # starting again replaces the loop that is running
+        aw.run()
+        aw.play()
+        aw.seek(0.5)
+        aw.play()
+        steps = [entry for entry in aw.pending if entry[3] == aw.play_step]
+        self.assertEqual(len(steps), 1)
+        aw.stop()
+        steps = [entry for entry in aw.pending if entry[3] == aw.play_step]
+        self.assertFalse(steps)
+
+        # playing to the end stops running
+        aw.play(start=2)
+        aw.mainloop()
+        self.assertFalse(aw.running)
+        aw.quit()
+
+    def test_seek(self):
+        # seek computes the trajectory if play hasn't
+        aw = AmoebaWorld.AmoebaWorld(interactive=True, backend='headless')
+        a = AmoebaWorld.Amoeba()
+        aw.set_end_time('1')
+        aw.set_x_t('2*t')
+        aw.seek(0.5)
+        self.assertAlmostEqual(a.x, 1.0)
+        self.assertFalse(aw.track is None)
+        aw.quit()
+
+    def test_slime(self):
+        aw = AmoebaWorld.AmoebaWorld(backend='headless')
+        a = AmoebaWorld.Amoeba()
+        a.draw()
+        n = len(aw.canvas.items)
+        for i in range(100):
+            a.move(i / 10.0, 0)
+        self.assertEqual(len(aw.canvas.items), n)
+
+        # a unit square is 20 pixels on a side
+        aw.slime.clear()
+        aw.slime.fill_polygon([[0, 0], [1, 0], [1, 1], [0, 1]], 'lavender')
+        aw.slime.fill_polygon([[1, 1], [2, 1], [2, 2], [1, 2]], 'lavender')
+        self.assertEqual(aw.slime.image.puts, 0)
+        self.assertEqual(aw.slime.bbox, [200, 160, 240, 200])
+        aw.slime.flush()
+        self.assertEqual(aw.slime.image.puts, 1)
+        self.assertEqual(aw.slime.bbox, None)
+
+        lavender = aw.slime.rgba('lavender')
+        self.assertEqual(aw.slime.pixels.count(lavender), 800)
+        aw.quit()
+
 if __name__ == '__main__':
     unittest.main()
@@ -52,5 +52,109 @@ class Tests(unittest.TestCase):
 
         cell.undraw()
 
+    def test_cell_grid(self):
+        cw = CellWorld.CellWorld(cell_size=10, grid_size=(20, 10), backend='headless')
+        self.assertEqual(len(cw.cells), 200)
+
+        cell = cw.make_cell(2, 3)
+        got = cw.get_cell(2, 3)
+        self.assertTrue(cell is got)
+        self.assertEqual(cw.get_cell(10, 0), None)
+
+        neighbors = cw.get_eight_neighbors(cw.get_cell(-10, -5))
+        self.assertEqual(neighbors.count(None), 5)
+
+        cell.mark()
+        self.assertTrue(cw.get_cell(2, 3).is_marked())
+        self.assertEqual(cell.get_config('fill'), 'black')
+        self.assertEqual(list(cw.cell_grid.marked()), [(2, 3)])
+
+        cell.toggle()
+        self.assertFalse(cell.is_marked())
+
+        cw.clear_cells()
+        cw.quit()
+
+    def test_neighbor_counts(self):
+        cw = CellWorld.CellWorld(grid_size=(10, 10), backend='headless')
+        for i, j in [(1, 0), (2, 1), (0, 2), (1, 2), (2, 2)]:
+            cw.get_cell(i, j).mark()
+
+        counts = cw.get_neighbor_counts(region=(1, 1, 1, 1))
+        self.assertEqual(list(counts), [5])
+
+        counts = cw.get_neighbor_counts(CellWorld.CellWorld.four_neighbors)
+        self.assertEqual(len(counts), 100)
+        self.assertEqual(sum(counts), 20)
+
+        states = cw.get_neighbor_states([(1, 0)], region=(0, 0, 2, 1))
+        self.assertEqual(list(states[0]), [1, 0])
+
+        # after four generations, a glider moves one cell diagonally
+        life = lambda state, count: int(count == 3 or (state and count == 2))
+        for i in range(4):
+            cw.cell_grid.apply_rule(life)
+        marked = sorted(cw.cell_grid.marked())
+        self.assertEqual(marked, [(1, 3), (2, 1), (2, 3), (3, 2), (3, 3)])
+
+        cw.cell_grid.set_state(0, 0, 2)
+        self.assertRaises(ValueError, cw.cell_grid.apply_rule, life)
+        cw.cell_grid.apply_rule(life, states=3)
+        cw.quit()
+
+    def test_grid_image(self):
+        cw = CellWorld.CellWorld(cell_size=4, interactive=True, grid_size=20,
+                                 backend='headless')
+        image = cw.grid_image
+        self.assertEqual(image.changed(), [])
+
+        cell = cw.get_cell(0, 0)
+        cell.mark()
+        cw.get_cell(1, 0).mark()
+        self.assertEqual(len(image.changed()), 2)
+
+        cw.flush()
+        self.assertEqual(image.changed(), [])
+        self.assertEqual(image.drawn, cw.cell_grid.state)
+
+        # one pixel per cell, zoomed to the cell size
+        self.assertEqual(image.image.width, 80)
+
+        # after a bulk change, the image compares every cell
+        cw.cell_grid.apply_rule(lambda state, count: 1)
+        self.assertEqual(len(image.changed()), 400 - 2)
+        cw.flush()
+        self.assertEqual(image.drawn, cw.cell_grid.state)
+
+        cw.rescale()
+        self.assertFalse(image is cw.grid_image)
+        cw.quit()
+
+    def test_tiled_grid(self):
+        cw = CellWorld.CellWorld(interactive=True, tile_size=16, backend='headless')
+        grid = cw.cell_grid
+        self.assertEqual(grid.memory_usage(), 0)
+
+        cell = cw.get_cell(1000, -1000)
+        self.assertFalse(cell.is_marked())
+        self.assertEqual(grid.memory_usage(), 0)
+
+        cell.mark()
+        cw.get_cell(0, 0).mark()
+        self.assertEqual(len(grid.tiles), 2)
+        self.assertEqual(grid.memory_usage(), 2 * 16 * 16)
+        self.assertEqual(sorted(grid.marked()), [(0, 0), (1000, -1000)])
+
+        # only the tile at the origin is on the canvas
+        cw.flush()
+        self.assertEqual(list(cw.grid_image.images), [(0, 0)])
+
+        counts = cw.get_neighbor_counts(region=(-1, -1, 3, 3))
+        self.assertEqual(list(counts), [1, 1, 1, 1, 0, 1, 1, 1, 1])
+
+        cw.clear_cells()
+        self.assertEqual(grid.memory_usage(), 0)
+        cw.quit()
+
 if __name__ == '__main__':
     unittest.main()
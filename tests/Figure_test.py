@@ -0,0 +1,60 @@
+"""This module is part of Swampy, a suite of programs available from
+allendowney.com/swampy.
+
+Copyright 2010 Allen B. Downey
+Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
+"""
+
+import os
+import tempfile
+import unittest
+import zlib
+
+from swampy import Figure
+from swampy import TurtleWorld
+
+class Tests(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def test_svg(self):
+        filename = os.path.join(self.dirname, 'square.svg')
+        fig = Figure.Figure(filename)
+        bob = TurtleWorld.Turtle(fig)
+        for i in range(4):
+            TurtleWorld.fd(bob, 100)
+            TurtleWorld.lt(bob)
+        TurtleWorld.pu(bob)
+        TurtleWorld.fd(bob, 10)
+        TurtleWorld.pd(bob)
+        TurtleWorld.set_pen_color(bob, 'red')
+        TurtleWorld.fd(bob, 10)
+        fig.close()
+
+        svg = open(filename).read()
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertTrue(svg.endswith('</svg>\n'))
+        self.assertEqual(svg.count('<polyline'), 2)
+        self.assertTrue('points="200,200 300,200 300,100 200,100 200,200"' in svg)
+        self.assertTrue('stroke="#ff0000"' in svg)
+
+    def test_png(self):
+        filename = os.path.join(self.dirname, 'line.png')
+        with Figure.Figure(filename, width=20, height=10) as fig:
+            bob = TurtleWorld.Turtle(fig)
+            bob.set_pen_color('black')
+            bob.fd(5)
+
+        data = open(filename, 'rb').read()
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        raw = zlib.decompress(data[41:-12])
+        self.assertEqual(len(raw), 10 * (1 + 3 * 20))
+
+        # row 5 has six black pixels, from x=10 to x=15
+        row = raw[5 * 61 + 1 : 6 * 61]
+        self.assertEqual(row.count(b'\0\0\0'), 6)
+        self.assertEqual(row[30:33], b'\0\0\0')
+
+if __name__ == '__main__':
+    unittest.main()
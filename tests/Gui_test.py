@@ -5,6 +5,8 @@ Copyright 2010 Allen B. Downey
 Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
 """
 
+import os
+import tempfile
 import unittest
 
 import tkinter
@@ -142,5 +144,60 @@ class Tests(unittest.TestCase):
     def test_item(self):
         pass
 
+    def test_headless(self):
+        gui = Gui.Gui(backend='headless')
+        self.assertTrue(gui.headless)
+        gui.title('headless')
+        self.assertEqual(gui.title(), 'headless')
+
+        ca = gui.ca(width=200, height=200)
+        self.assertTrue(isinstance(ca, Gui.HeadlessCanvas))
+        item = ca.rectangle([[0, 0], [10, 20]], fill='red', tags='box')
+        self.assertEqual(ca.coords(item.tag), [100, 100, 110, 80])
+        self.assertEqual(item.cget('fill'), 'red')
+        self.assertEqual(ca.find_withtag('box'), [item.tag])
+
+        item.move(5, 5)
+        bbox = item.bbox()
+        self.assertEqual(bbox.left, 5)
+        self.assertEqual(bbox.top, 15)
+        self.assertEqual(ca.winfo_rgb('red'), (65535, 0, 0))
+
+        item.delete()
+        self.assertEqual(len(ca.items), 0)
+
+        calls = []
+        button = gui.bu(text='press', command=lambda: calls.append('press'))
+        button.invoke()
+        gui.after(1000, calls.append, 'later')
+        gui.after(0, calls.append, 'now')
+        gui.update()
+        self.assertEqual(calls, ['press', 'now'])
+        gui.mainloop()
+        self.assertEqual(calls, ['press', 'now', 'later'])
+
+        entry = gui.en(text='abc')
+        entry.insert(tkinter.END, 'def')
+        self.assertEqual(entry.get(), 'abcdef')
+        gui.destroy()
+
+    def test_headless_dump(self):
+        gui = Gui.Gui(backend='headless')
+        ca = gui.ca(width=200, height=200)
+        ca.line([[0, 0], [50, 50]], fill='red')
+        ca.polygon([[0, 0], [10, 0], [0, 10]], fill='blue')
+        ca.rectangle([[0, 0], [10, 20]], fill='red')
+        ca.text([0, 0], 'not drawn')
+
+        dirname = tempfile.mkdtemp()
+        filename = ca.dump(os.path.join(dirname, 'canvas.eps'))
+        self.assertEqual(filename, os.path.join(dirname, 'canvas.svg'))
+        svg = open(filename).read()
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertEqual(svg.count('<polyline'), 3)
+        self.assertTrue('points="100,100 150,50"' in svg)
+        self.assertTrue('points="100,100 110,100 110,80 100,80 100,100"' in svg)
+        gui.destroy()
+
 if __name__ == '__main__':
     unittest.main()
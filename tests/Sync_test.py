@@ -5,12 +5,66 @@ Copyright 2011 Allen B. Downey
 Distributed under the GNU General Public License at gnu.org/licenses/gpl.html.
 """
 
+import os
+import sys
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 from swampy import Sync
 
+MUTEX = """
+mutex = Semaphore(1)
+
+## Thread
+mutex.wait()
+# critical section
+mutex.signal()
+"""
+
+DEADLOCK = """
+aArrived = Semaphore(0)
+bArrived = Semaphore(0)
+
+## Thread A
+bArrived.wait()
+aArrived.signal()
+
+## Thread B
+aArrived.wait()
+bArrived.signal()
+"""
+
+PRIORITY = """
+sem = PrioritySemaphore(0)
+
+## Thread
+sem.wait(priority=-ord(pid()))
+
+## Thread
+sem.signal()
+"""
+
 class Tests(unittest.TestCase):
 
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dirname = self.tempdir.name
+
+        # only the tests of the cache write cache files (see write_caches)
+        self.addCleanup(setattr, sys, 'dont_write_bytecode',
+                        sys.dont_write_bytecode)
+        sys.dont_write_bytecode = True
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write_code(self, code):
+        fd, filename = tempfile.mkstemp(suffix='.py', dir=self.dirname)
+        os.write(fd, code.encode())
+        os.close(fd)
+        return filename
+
     def test_sync_mutex(self):
         sync = Sync.Sync(['sync_code/mutex.py'])
 
@@ -95,6 +149,332 @@ class Tests(unittest.TestCase):
         source = threadA.step()
         self.assertEqual(source, 'pass')
 
+    def test_queue_canvas(self):
+        sync = Sync.Sync([self.write_code(MUTEX)], backend='headless')
+        column = sync.cols[0]
+        threads = [column.create_thread() for i in range(3)]
+        sync.update()
+
+        # the threads are drawn once, when the GUI is idle
+        row = column.rows[0]
+        names = [thread.name for thread in row.runnable.drawn]
+        self.assertEqual(sorted(names), ['A', 'B', 'C', 'D'])
+        for thread in threads:
+            thread.step()
+        self.assertEqual(len(sync.dirty), 3)
+
+        sync.update()
+        self.assertEqual(sync.dirty, set())
+        names = [thread.name for thread in row.runnable.drawn]
+        self.assertEqual(names, ['A'])
+        self.assertEqual(list(row.queued.drawn), threads[1:])
+        self.assertEqual(len(row.queued.find_withtag('ThreadC')), 2)
+
+        # when one leaves the queue, the other moves up
+        threads[0].step()
+        threads[0].step()
+        sync.update()
+        [thread] = row.queued.drawn
+        self.assertEqual(row.queued.drawn[thread], (Sync.FSU, Sync.FSU))
+        x1, y1, x2, y2 = row.queued.pixel_bbox(thread.tag)
+        self.assertAlmostEqual((x1 + x2) / 2, Sync.FSU)
+
+    def test_trace(self):
+        filename = self.write_code(MUTEX)
+        sync = Sync.Sync([filename], backend='headless')
+        trace = self.write_code('')
+        sync.record(trace)
+        sync.cols[0].create_thread()
+        sync.cols[0].create_thread()
+        for i in range(30):
+            sync.threads[i % 3].step_loop()
+        sync.stop_recording()
+
+        def get_state(threads):
+            return [(t.name, t.row.get(), t.queued) for t in threads]
+        state = get_state(sync.threads)
+
+        header, events = Sync.read_trace(trace)
+        self.assertEqual(header['threads'], [['A', 0]])
+        self.assertEqual(events[0], {'create': 0, 'thread': 'B'})
+        self.assertEqual(events[2], {'step': 'A', 'row': 0,
+                                     'vars': {'mutex': '0'}})
+        self.assertEqual(events[3], {'step': 'B', 'row': 0,
+                                     'vars': {'mutex': '-1'},
+                                     'blocked': ['B']})
+        n = len(events)
+
+        # replay in the GUI, then back up and go forward again
+        sync.load_trace(trace)
+        self.assertEqual(sync.position, 0)
+        sync.seek(n)
+        self.assertEqual(get_state(sync.threads), state)
+        sync.seek(10)
+        sync.step_back()
+        self.assertEqual(sync.position, 9)
+        sync.play(delay=0)
+        self.assertEqual(get_state(sync.threads), state)
+
+        # and without the GUI
+        explorer = Sync.Explorer(filename)
+        threads = explorer.replay_file(trace)
+        self.assertEqual(get_state(threads), state)
+
+    def test_views(self):
+        code = MUTEX.replace('mutex = Semaphore(1)',
+                             'mutex = Semaphore(1)\ncount = 0')
+        code = code.replace('# critical section', 'count += 1')
+        filename = self.write_code(code)
+        sync = Sync.Sync([filename], backend='headless')
+
+        def view_text(key):
+            row = sync.views[key]
+            return row.tag.cget('text')
+
+        self.assertEqual(view_text('mutex'), '1')
+        thread = sync.threads[0]
+        thread.step()
+        self.assertEqual(view_text('mutex'), '0')
+        thread.step()
+        self.assertEqual(view_text('count'), '1')
+        self.assertEqual(view_text('mutex'), '0')
+        thread.step()
+        self.assertEqual(view_text('mutex'), '1')
+
+    def test_unwatched_views(self):
+        # lists don't report changes, so their views are always updated
+        code = MUTEX.replace('mutex = Semaphore(1)',
+                             'mutex = Semaphore(1)\nitems = []')
+        code = code.replace('# critical section', 'items.append(1)')
+        filename = self.write_code(code)
+        sync = Sync.Sync([filename], backend='headless')
+        row = sync.views['items']
+
+        thread = sync.threads[0]
+        thread.step()
+        thread.step()
+        self.assertEqual(row.tag.cget('text'), '[1]')
+
+        locals = sync.locals
+        self.assertEqual(locals.unwatched, set(['items']))
+        self.assertEqual(locals.names[id(locals['mutex'])], set(['mutex']))
+        del locals['items']
+        self.assertEqual(locals.unwatched, set())
+
+    def test_sessions(self):
+        filename = self.write_code(MUTEX)
+        sync1 = Sync.Sync([filename], backend='headless')
+        sync2 = Sync.Sync([filename], backend='headless')
+        sync1.threads[0].step()
+        self.assertEqual(sync1.locals['mutex'].n, 0)
+        self.assertEqual(sync2.locals['mutex'].n, 1)
+        self.assertEqual(sync1.current_thread, sync1.threads[0])
+        self.assertEqual(sync2.current_thread.name, '0')
+
+        # simulations in different threads don't interfere
+        jobs = [(filename, dict(threads=3), range(i, i+20), 300)
+                for i in range(0, 80, 20)]
+        expected = [Sync.fuzz_seeds(job).progress for job in jobs]
+        with ThreadPoolExecutor(4) as pool:
+            reports = list(pool.map(Sync.fuzz_seeds, jobs))
+        self.assertEqual([report.progress for report in reports], expected)
+
+    def test_line(self):
+        line = Sync.Line('counter += 1')
+        self.assertEqual(line.keyword, None)
+        self.assertEqual(line.indent, 0)
+
+        line = Sync.Line('    if counter == 0:')
+        self.assertEqual(line.keyword, 'if')
+        self.assertEqual(line.indent, 4)
+        self.assertEqual(eval(line.code, dict(counter=0)), True)
+
+        line = Sync.Line('while counter < 1:')
+        self.assertEqual(line.keyword, 'while')
+
+        line = Sync.Line('else:')
+        self.assertEqual(line.keyword, 'else')
+        self.assertEqual(line.code, None)
+
+        self.assertRaises(SyntaxError, Sync.Line, 'if counter == 0')
+        self.assertRaises(SyntaxError, Sync.Line, 'counter +')
+
+    def test_locals(self):
+        locals = Sync.Locals(x=1, z=[])
+        exec('x += 1\ny = 3\nz = z', {}, locals)
+        self.assertEqual(locals.defined, set(['y']))
+        self.assertEqual(locals.changed, set(['x']))
+
+        locals.clear_writes()
+        self.assertEqual(locals.changed, set())
+
+    def test_row_table(self):
+        lines = ['while x:', '    if y:', '        a', '    b', 'c', '    d']
+        rows = [Sync.CodeRow(line, i) for i, line in enumerate(lines)]
+        table = Sync.RowTable(rows)
+        self.assertEqual(table.indents, [0, 4, 8, 4, 0, 4])
+        self.assertEqual(table.ends, [4, 3, 3, 4, 6, 6])
+        self.assertEqual(table.next_row(rows[2]), rows[3])
+        self.assertEqual(table.next_row(rows[5]), None)
+        self.assertEqual(table.end_of_block(rows[1]), rows[3])
+        self.assertEqual(table.end_of_block(rows[4]), None)
+
+    def test_explore(self):
+        filename = self.write_code(MUTEX)
+        report = Sync.Explorer(filename, threads=2).explore()
+        self.assertTrue(report.complete)
+        self.assertEqual(report.findings, [])
+
+        # with a random queue, one of three threads can wait forever
+        report = Sync.Explorer(filename, threads=3).explore()
+        starvation = report.get('starvation')[0]
+        self.assertEqual(len(starvation.threads), 1)
+        self.assertTrue(starvation.loop < len(starvation.trace))
+
+        # without the wait, two threads can get in
+        filename = self.write_code(MUTEX.replace('mutex.wait()', 'pass'))
+        report = Sync.Explorer(filename, threads=2).explore()
+        violation = report.get('violation')[0]
+        self.assertEqual(violation.threads, ['A', 'B'])
+
+    def test_semaphores(self):
+        explorer = Sync.Explorer(self.write_code(PRIORITY), threads=[3, 1])
+        threads = explorer.replay('A B C')
+        sem = explorer.locals['sem']
+        names = [thread.name for thread in sem.waiting()]
+        self.assertEqual(names, ['C', 'B', 'A'])
+
+        threads = explorer.replay('A B C D')
+        self.assertEqual([t.queued for t in threads], [True, True, False, False])
+
+        # a FIFO queue is strong: nobody waits forever
+        code = MUTEX.replace('Semaphore', 'StrongSemaphore')
+        report = Sync.Explorer(self.write_code(code), threads=3).explore()
+        self.assertTrue(report.complete)
+        self.assertEqual(report.findings, [])
+
+    def test_deadlock(self):
+        filename = self.write_code(DEADLOCK)
+        explorer = Sync.Explorer(filename)
+        report = explorer.explore()
+        deadlock = report.get('deadlock')[0]
+        self.assertEqual(deadlock.threads, ['A', 'B'])
+
+        trace = Sync.format_trace(deadlock.trace)
+        self.assertEqual(Sync.parse_trace(trace), deadlock.trace)
+
+        threads = explorer.replay(trace)
+        self.assertTrue(all(thread.queued for thread in threads))
+
+    def test_fuzz(self):
+        filename = self.write_code(DEADLOCK)
+        stats = Sync.fuzz(filename, 20, steps=50, processes=1)
+        self.assertEqual(stats.runs, 20)
+        self.assertEqual(stats.rate('deadlock'), 1.0)
+        self.assertEqual(stats.first['deadlock'][0], 0)
+        self.assertEqual(stats.max_queue, dict(aArrived=1, bArrived=1))
+
+        # a run's trace leads to the same place when replayed
+        explorer = Sync.Explorer(filename)
+        finding = explorer.random_run(3)
+        threads = explorer.replay(finding.trace)
+        self.assertTrue(all(thread.queued for thread in threads))
+
+        filename = self.write_code(MUTEX)
+        stats = Sync.fuzz(filename, 10, steps=100, processes=1, threads=3)
+        self.assertEqual(stats.counts, {})
+        self.assertEqual(stats.steps, 1000)
+        self.assertEqual(sorted(stats.progress), ['A', 'B', 'C'])
+
+        # merging the results from workers
+        total = Sync.FuzzReport()
+        total.update(stats)
+        total.update(stats)
+        self.assertEqual(total.runs, 20)
+        self.assertEqual(total.max_queue, stats.max_queue)
+
+    def write_caches(self, prefix=None):
+        """Makes load_program write cache files, whatever the environment says."""
+        self.addCleanup(setattr, sys, 'dont_write_bytecode',
+                        sys.dont_write_bytecode)
+        self.addCleanup(setattr, sys, 'pycache_prefix', sys.pycache_prefix)
+        sys.dont_write_bytecode = False
+        sys.pycache_prefix = prefix
+
+    def test_load_program(self):
+        self.write_caches()
+        filename = self.write_code(MUTEX + '\nx = (\n')
+        cache = Sync.cache_filename(filename)
+
+        program = Sync.load_program(filename)
+        self.assertTrue(os.path.exists(cache))
+        cached = Sync.load_program(filename)
+        self.assertEqual(len(cached.blocks), len(program.blocks))
+        for block1, block2 in zip(program.blocks, cached.blocks):
+            self.assertEqual(block1.lines, block2.lines)
+            self.assertEqual(block1.indents, block2.indents)
+            self.assertEqual(block1.ends, block2.ends)
+            self.assertEqual(block1.codes, block2.codes)
+
+        # the bad line is stored without code and fails when used
+        block = cached.blocks[-1]
+        self.assertEqual(block.lines[-1], 'x = (')
+        self.assertEqual(block.codes[-1], None)
+        self.assertRaises(SyntaxError, block.get_line, len(block.lines) - 1)
+        self.assertEqual(block.get_line(0).source, block.lines[0])
+
+        # changing the file invalidates the cache
+        fp = open(filename, 'w')
+        fp.write(MUTEX)
+        fp.close()
+        program = Sync.load_program(filename)
+        self.assertEqual(program.blocks[-1].codes.count(None), 0)
+        program = Sync.load_program(filename, cache=False)
+        self.assertEqual(program.blocks[-1].codes.count(None), 0)
+
+    def test_cache_location(self):
+        self.write_caches()
+        dirname = self.dirname
+        filename = os.path.join(dirname, 'mutex.py')
+        fp = open(filename, 'w')
+        fp.write(MUTEX)
+        fp.close()
+        cache = Sync.cache_filename(filename)
+        self.assertEqual(os.path.dirname(cache),
+                         os.path.join(dirname, '__pycache__'))
+
+        # a read-only directory gets no cache file, but still loads
+        os.chmod(dirname, 0o555)
+        try:
+            program = Sync.load_program(filename)
+            self.assertEqual(program.blocks[-1].lines[0], 'mutex.wait()')
+            if not os.access(dirname, os.W_OK):
+                self.assertFalse(os.path.exists(cache))
+        finally:
+            os.chmod(dirname, 0o755)
+        if os.path.exists(cache):
+            os.remove(cache)
+
+        # like the import system, don't write if asked not to
+        sys.dont_write_bytecode = True
+        Sync.load_program(filename)
+        self.assertFalse(os.path.exists(cache))
+        sys.dont_write_bytecode = False
+
+        # and put cache files under pycache_prefix
+        sys.pycache_prefix = os.path.join(dirname, 'prefix')
+        prefixed = Sync.cache_filename(filename)
+        self.assertTrue(prefixed.startswith(sys.pycache_prefix))
+        Sync.load_program(filename)
+        self.assertTrue(os.path.exists(prefixed))
+        self.assertFalse(os.path.exists(cache))
+
+    def test_next_script(self):
+        self.assertEqual(Sync.next_script([], []), None)
+        self.assertEqual(Sync.next_script([0, 0], [2, 3]), [0, 1])
+        self.assertEqual(Sync.next_script([0, 2], [2, 3]), [1])
+        self.assertEqual(Sync.next_script([1, 2], [2, 3]), None)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -31,5 +31,99 @@ class Tests(unittest.TestCase):
         t.undraw()
         tw.quit()
 
+    def test_fast_forward(self):
+        tw1 = TurmiteWorld.TurmiteWorld(grid_size=100, backend='headless')
+        t1 = TurmiteWorld.Turmite(tw1)
+        for i in range(500):
+            tw1.step()
+
+        tw2 = TurmiteWorld.TurmiteWorld(grid_size=100, backend='headless')
+        t2 = TurmiteWorld.Turmite(tw2)
+        steps = tw2.fast_forward(500)
+        self.assertEqual(steps, 500)
+
+        self.assertEqual(tw1.cell_grid.state, tw2.cell_grid.state)
+        self.assertEqual((t1.x, t1.y, t1.dir), (t2.x, t2.y, t2.dir))
+        tw1.quit()
+        tw2.quit()
+
+    def test_rule(self):
+        rule = TurmiteWorld.TurmiteRule.from_string('LLRR')
+        self.assertEqual(rule.num_colors, 4)
+        self.assertEqual(rule.lookup(0, 3), (0, 3, 0))
+
+        tw = TurmiteWorld.TurmiteWorld(grid_size=10, backend='headless')
+        t = TurmiteWorld.Turmite(tw, rule)
+        steps = tw.fast_forward(10000)
+        self.assertEqual(steps, 1129)
+        self.assertFalse(tw.cell_grid.contains(t.x, t.y))
+        tw.quit()
+
+    def test_dict_cells(self):
+        # a rule with three colors runs the same way with or without a grid
+        rule = TurmiteWorld.TurmiteRule.from_string('RLR')
+        tw1 = TurmiteWorld.TurmiteWorld(backend='headless')
+        t1 = TurmiteWorld.Turmite(tw1, rule)
+        tw2 = TurmiteWorld.TurmiteWorld(grid_size=100, backend='headless')
+        t2 = TurmiteWorld.Turmite(tw2, rule)
+        for i in range(200):
+            tw1.step()
+            tw2.step()
+
+        self.assertEqual((t1.x, t1.y, t1.dir), (t2.x, t2.y, t2.dir))
+        for (i, j), cell in tw1.cells.items():
+            self.assertEqual(cell.get_state(), tw2.cell_grid.get_state(i, j))
+        self.assertTrue(2 in [c.get_state() for c in tw1.cells.values()])
+        tw1.quit()
+        tw2.quit()
+
+    def test_tiled(self):
+        tw = TurmiteWorld.TurmiteWorld(tile_size=16, backend='headless')
+        t = TurmiteWorld.Turmite(tw)
+        steps = tw.fast_forward(20000)
+        self.assertEqual(steps, 20000)
+        self.assertTrue(len(tw.cell_grid.tiles) > 1)
+        tw.quit()
+
+    def test_batch(self):
+        tw = TurmiteWorld.TurmiteWorld(grid_size=100, backend='headless')
+        batch = TurmiteWorld.TurmiteBatch(tw)
+        batch.add(0, 0)
+        batch.add(0, 0, dir=2)
+        self.assertEqual(len(batch), 2)
+
+        # both turmites see the unmarked cell and turn right
+        tw.step()
+        self.assertEqual(batch.get_positions(), [(0, -1), (0, 1)])
+        self.assertEqual(list(batch.dir), [3, 1])
+        self.assertEqual(tw.cell_grid.get_state(0, 0), 1)
+
+        steps = tw.fast_forward(100)
+        self.assertEqual(steps, 100)
+        tw.quit()
+
+    def test_batch_drawing(self):
+        tw = TurmiteWorld.TurmiteWorld(grid_size=100, backend='headless')
+        batch = TurmiteWorld.TurmiteBatch(tw)
+        batch.add(0, 0)
+        batch.add(5, 5)
+
+        def get_coords():
+            return [tw.canvas.coords(id) for id in tw.canvas.find_withtag(batch.tag)]
+
+        coords = get_coords()
+        self.assertEqual(len(coords), 2)
+
+        tw.step()
+        tw.step()
+        moved = get_coords()
+        self.assertEqual(len(moved), 2)
+        self.assertNotEqual(moved, coords)
+
+        # the triangles are where a fresh drawing would put them
+        batch.redraw()
+        self.assertEqual(get_coords(), moved)
+        tw.quit()
+
 if __name__ == '__main__':
     unittest.main()
@@ -55,5 +55,27 @@ class Tests(unittest.TestCase):
 
         tw.quit()
 
+    def test_batch(self):
+        tw = TurtleWorld.TurtleWorld(backend='headless')
+        t = TurtleWorld.Turtle(tw)
+        t.begin_batch(frame_size=100)
+        for i in range(4):
+            t.fd(10)
+            t.lt()
+        t.pu()
+        t.fd(20)
+        t.pd()
+        t.fd(10)
+        t.set_pen_color('red')
+        t.fd(10)
+        self.assertEqual(len(tw.canvas.find_withtag('all')), 4)
+
+        t.end_batch()
+        self.assertEqual(len(t.strokes), 3)
+        self.assertEqual(len(t.strokes[0].points), 5)
+        self.assertEqual(len(tw.canvas.find_withtag('all')), 7)
+        self.assertAlmostEqual(t.get_x(), 40)
+        tw.quit()
+
 if __name__ == '__main__':
     unittest.main()
@@ -71,6 +71,97 @@ class Tests(unittest.TestCase):
         self.assertEqual(animal.delay, 0.4)
         self.assertEqual(world.delay, 0.4)
 
+    def test_polar(self):
+        world = World.World(backend='headless')
+        animal = World.Animal()
+        x, y = animal.polar(1, 2, 10, 90)
+        self.assertAlmostEqual(x, 1)
+        self.assertAlmostEqual(y, 12)
+        self.assertTrue(90 in World.Animal.unit_circle)
+
+        template = animal.template((0, 90, 180))
+        self.assertTrue(animal.template((0, 90, 180)) is template)
+        coords = animal.shape(1, 1, template, [1, 2, 3])
+        self.assertAlmostEqual(coords[1][1], 3)
+        self.assertAlmostEqual(coords[2][0], -2)
+
+        # when the cache is full, templates are made but not kept
+        self.addCleanup(setattr, World.Animal, 'max_templates',
+                        World.Animal.max_templates)
+        World.Animal.max_templates = len(World.Animal.templates)
+        template = animal.template((1, 2))
+        self.assertEqual(len(template), 2)
+        self.assertFalse((1, 2) in World.Animal.templates)
+        world.quit()
+
+    def test_run(self):
+        world = World.World(backend='headless')
+
+        class Counter(World.Animal):
+            count = 0
+            def step(self):
+                self.count += 1
+                if self.count == 25:
+                    self.world.stop()
+
+        animal = Counter()
+        world.run(steps_per_frame=10)
+        self.assertEqual(animal.count, 25)
+
+        world.steps_per_frame = 10
+        world.fps = 100
+        world.adapt_steps(0.001, 0.0)
+        self.assertEqual(world.steps_per_frame, 20)
+        world.adapt_steps(0.02, 0.0)
+        self.assertEqual(world.steps_per_frame, 10)
+        world.adapt_steps(0.001, 0.02)
+        self.assertEqual(world.steps_per_frame, 5)
+        world.quit()
+
+    def test_headless(self):
+        world = World.World(backend='headless')
+        world.canvas = world.ca(width=200, height=200)
+        animal = World.Animal()
+        animal.tag = 'animal'
+        animal.draw = lambda: world.canvas.circle([0, 0], 5, tags='animal')
+        animal.redraw()
+        self.assertEqual(len(world.canvas.find_withtag('animal')), 1)
+
+        world.after(0, world.stop)
+        world.run(steps_per_frame=3)
+        self.assertFalse(world.running)
+        world.sleep()
+        animal.die()
+        self.assertEqual(world.canvas.items, {})
+        world.quit()
+
+    def test_animate(self):
+        world = World.World(backend='headless')
+        world.delay = 0.2
+        log = []
+
+        def task(name, delay):
+            for i in range(3):
+                log.append((name, world.clock))
+                world.sleep()
+                yield delay
+
+        world.animate(task('a', 0.1), task('b', None))
+        world.mainloop()
+        self.assertEqual(log, [('a', 0), ('b', 0), ('a', 100),
+                               ('b', 200), ('a', 200), ('b', 400)])
+
+        # with no delay, sleep does not even update
+        world.delay = 0
+        world.after(0, log.append, 'update')
+        world.sleep()
+        self.assertEqual(log[-1], ('b', 400))
+        world.delay = 0.5
+        world.sleep()
+        self.assertEqual(log[-1], 'update')
+        self.assertEqual(world.clock, 1100)
+        world.quit()
+
         
         
 